@@ -5,10 +5,14 @@ from django.contrib.auth.models import User
 from .models import AdminActivityLog
 from .forms import ProductForm 
 from main.models import Admin
-from order.models import Order, OrderStatus
-from product.views import get_product 
+from order.models import Order
+from order import statuses
+from order.transitions import transition
+from product.views import get_product, load_all_products
+from product.cache import get_or_load
 from product.models import Product
 from django.http import JsonResponse
+from django.db import transaction
 @login_required
 def dashboard(request):
     users = User.objects.all().order_by('-date_joined')
@@ -41,10 +45,8 @@ def dashboard(request):
 @login_required
 def delete_user(request, user_id):
     # Check if the current user is an admin
-    try:
-        admin = Admin.objects.get(user=request.user)
-        # User is an admin, proceed with deletion
-    except Admin.DoesNotExist:
+    admin = request.profile
+    if not isinstance(admin, Admin):
         # User is not an admin, redirect to no permission page
         return redirect('no_permission')
 
@@ -88,7 +90,8 @@ def update_product(request, product_id):
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
-            form.save()
+            # only write the form fields so reservations made meanwhile are not overwritten
+            form.save(commit=False).save(update_fields=ProductForm.Meta.fields)
             return redirect('administrator:product_dashboard')
     else:
         form = ProductForm(instance=product)
@@ -105,22 +108,13 @@ def delete_product(request, product_id):
 
 @login_required
 def all_product(request):
-    products = Product.objects.all() 
-    product_json = [
-        {
-            'id' : product.id,
-            'product_name': product.product_name,
-            'stock': product.stock,
-            'price': float(product.price),
-            'description': product.description,
-        } for product in products
-    ]
-     
+    product_json = get_or_load('all', load_all_products)
     return JsonResponse(data={'products' : product_json})
 
 @login_required
 def process_order(request, order_id):
-    order = Order.objects.get(pk=order_id)
-    order.status = OrderStatus.objects.filter(status='ready').first()
-    order.save()
+    # "Order Is Ready" is offered on paid orders, which pass through prepared on the way
+    with transaction.atomic():
+        transition(order_id, statuses.PREPARED)
+        transition(order_id, statuses.READY)
     return redirect("order:order_detail", id=order_id)
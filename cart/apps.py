@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete, pre_delete
 
 
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        from .cache import bump_cart_version
+        post_save.connect(bump_cart_version, sender='cart.ProductCart')
+        post_delete.connect(bump_cart_version, sender='cart.ProductCart')
+        # every delete, including cascades, gives the held stock back
+        from product.reservations import release_deleted_cart, release_deleted_line
+        pre_delete.connect(release_deleted_cart, sender='cart.Cart')
+        pre_delete.connect(release_deleted_line, sender='cart.ProductCart')
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from core.versioning import get_version, bump_version
+from main.models import Customer
+from .models import Cart
+import uuid
+
+CART_VERSION_KEY = 'cart:{}:version'
+
+def _version_key(cart_id):
+    # ids come in as UUIDs or as URL strings with or without hyphens, all map to one key
+    return CART_VERSION_KEY.format(uuid.UUID(str(cart_id)))
+
+def get_cart_version(cart_id):
+    return get_version(_version_key(cart_id))
+
+def bump_cart(cart_id):
+    bump_version(_version_key(cart_id))
+
+def bump_cart_version(sender, instance, **kwargs):
+    bump_cart(instance.cart_id)
+
+ACTIVE_CART_KEY = 'cart:active:user:{}'
+ACTIVE_CART_TIMEOUT = 60 * 60 * 24
+
+def resolve_active_cart_id(user):
+    """
+    Return the id of the user's open cart, creating it when needed, or None when
+    the user is not a customer. The id is cached per user so the hot path runs no
+    query; checkout_cart and delete_cart forget it.
+    """
+    key = ACTIVE_CART_KEY.format(user.id)
+    cart_id = cache.get(key)
+    if cart_id is not None:
+        return cart_id
+
+    customer_id = Customer.objects.filter(user=user).values_list('id', flat=True).first()
+    if customer_id is None:
+        return None
+    cart_id = Cart.objects.filter(customer_id=customer_id, is_checked_out=False).values_list('id', flat=True).first()
+    if cart_id is None:
+        try:
+            with transaction.atomic():
+                cart_id = Cart.objects.create(customer_id=customer_id).id
+        except IntegrityError:
+            # a concurrent request created the open cart first
+            cart_id = Cart.objects.get(customer_id=customer_id, is_checked_out=False).id
+
+    cache.set(key, cart_id, ACTIVE_CART_TIMEOUT)
+    return cart_id
+
+def forget_active_cart(user_id):
+    cache.delete(ACTIVE_CART_KEY.format(user_id))
@@ -6,6 +6,16 @@ import uuid
 class Cart(models.Model):
     class Meta:
         permissions = [('checkout_cart', 'Can checkout cart')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer'],
+                condition=models.Q(is_checked_out=False),
+                name='one_open_cart_per_customer',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['customer', 'is_checked_out'], name='cart_customer_open_idx'),
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     created_at = models.DateField(auto_now=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
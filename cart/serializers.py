@@ -0,0 +1,36 @@
+from .models import ProductCart
+
+CART_LINE_FIELDS = (
+    'id',
+    'quantity',
+    'product_id',
+    'product__product_name',
+    'product__stock',
+    'product__price',
+    'product__description',
+)
+
+def serialize_cart_lines(cart_id):
+    """
+    Return (lines, total) for a cart with one joined query. Rows come from values()
+    so no model instances are built, each line carries its own subtotal.
+    """
+    rows = ProductCart.objects.filter(cart_id=cart_id).values(*CART_LINE_FIELDS)
+    lines = []
+    total = 0
+    for row in rows:
+        subtotal = row['product__price'] * row['quantity']
+        total += subtotal
+        lines.append({
+            'product' : {
+                'product_id': row['product_id'],
+                'product_name': row['product__product_name'],
+                'product_stock': row['product__stock'],
+                'product_price': row['product__price'],
+                'product_description': row['product__description']
+            },
+            'id': row['id'],
+            'quantity': row['quantity'],
+            'subtotal': subtotal,
+        })
+    return lines, total
@@ -1,3 +1,125 @@
-from django.test import TestCase
+import json
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.core.cache import cache
+from django.contrib.auth.models import User, Permission
+from main.models import Customer
+from product.models import Product
+from .models import Cart, ProductCart
+from .serializers import serialize_cart_lines
+from .cache import resolve_active_cart_id, forget_active_cart
+from django.db import IntegrityError, transaction
 
-# Create your tests here.
+class CartSerializerTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='customer', password='password123')
+        self.customer = Customer.objects.create(user=user)
+        self.cart = Cart.objects.create(customer=self.customer)
+        for i in range(5):
+            product = Product.objects.create(product_name=f'product{i}', stock=10, price=1000 * (i + 1), description='')
+            ProductCart.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_serialize_cart_lines_uses_one_query(self):
+        with self.assertNumQueries(1):
+            lines, total = serialize_cart_lines(self.cart.id)
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(total, 2 * (1000 + 2000 + 3000 + 4000 + 5000))
+        line = next(line for line in lines if line['product']['product_name'] == 'product1')
+        self.assertEqual(line['subtotal'], 4000)
+
+class BatchUpdateCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='customer', password='password123')
+        for codename in ['add_productcart', 'change_cart', 'delete_productcart']:
+            user.user_permissions.add(Permission.objects.get(codename=codename))
+        self.customer = Customer.objects.create(user=user)
+        self.cart = Cart.objects.create(customer=self.customer)
+        self.rice = Product.objects.create(product_name='rice', stock=5, price=1000, description='')
+        self.soap = Product.objects.create(product_name='soap', stock=5, price=2000, description='')
+        self.oil = Product.objects.create(product_name='oil', stock=5, price=3000, description='')
+        ProductCart.objects.create(cart=self.cart, product=self.soap, quantity=1)
+        ProductCart.objects.create(cart=self.cart, product=self.oil, quantity=1)
+
+        self.client = Client()
+        self.client.force_login(user)
+
+    def batch(self, operations):
+        return self.client.post(
+            reverse('cart:batch_update_cart'),
+            json.dumps({'operations': operations}),
+            content_type='application/json',
+        )
+
+    def test_batch_applies_all_operations(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': str(self.rice.id), 'amount': 2},
+            {'op': 'add', 'product_id': str(self.rice.id), 'amount': 1},
+            {'op': 'set', 'product_id': str(self.soap.id), 'amount': 4},
+            {'op': 'remove', 'product_id': str(self.oil.id)},
+        ])
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(ProductCart.objects.filter(cart=self.cart).values_list('product__product_name', 'quantity'))
+        self.assertEqual(quantities, {'rice': 3, 'soap': 4})
+        self.assertEqual(int(response.json()['total']), 3 * 1000 + 4 * 2000)
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.batch([
+            {'op': 'add', 'product_id': str(self.rice.id), 'amount': 2},
+            {'op': 'set', 'product_id': str(self.soap.id), 'amount': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        quantities = dict(ProductCart.objects.filter(cart=self.cart).values_list('product__product_name', 'quantity'))
+        self.assertEqual(quantities, {'soap': 1, 'oil': 1})
+
+    def test_removed_lines_give_their_hold_back(self):
+        self.batch([{'op': 'add', 'product_id': str(self.rice.id), 'amount': 2}])
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.reserved, 2)
+        self.batch([{'op': 'remove', 'product_id': str(self.rice.id)}])
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.reserved, 0)
+
+    def test_remove_needs_delete_permission(self):
+        user = User.objects.get(username='customer')
+        user.user_permissions.remove(Permission.objects.get(codename='delete_productcart'))
+        self.client.force_login(User.objects.get(pk=user.pk))
+        response = self.batch([{'op': 'remove', 'product_id': str(self.oil.id)}])
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(ProductCart.objects.filter(cart=self.cart, product=self.oil).exists())
+
+    def test_cart_etag_follows_writes_for_any_id_spelling(self):
+        user = User.objects.get(username='customer')
+        user.user_permissions.add(Permission.objects.get(codename='view_cart'))
+        self.client.force_login(User.objects.get(pk=user.pk))
+        url = reverse('cart:view_cart', args=[self.cart.id.hex])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch([{'op': 'add', 'product_id': str(self.rice.id), 'amount': 1}])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class ActiveCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='customer', password='password123')
+        self.customer = Customer.objects.create(user=self.user)
+
+    def test_resolver_creates_one_cart_and_caches_it(self):
+        cart_id = resolve_active_cart_id(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_active_cart_id(self.user), cart_id)
+        self.assertEqual(Cart.objects.filter(customer=self.customer).count(), 1)
+
+    def test_only_one_open_cart_per_customer(self):
+        Cart.objects.create(customer=self.customer)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Cart.objects.create(customer=self.customer)
+        Cart.objects.create(customer=self.customer, is_checked_out=True)
+
+    def test_resolver_skips_checked_out_cart_after_forget(self):
+        cart_id = resolve_active_cart_id(self.user)
+        Cart.objects.filter(id=cart_id).update(is_checked_out=True)
+        forget_active_cart(self.user.id)
+        self.assertNotEqual(resolve_active_cart_id(self.user), cart_id)
@@ -1,12 +1,21 @@
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required, permission_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
+from django.views.decorators.cache import cache_control
+from django.db import transaction
 from .models import Cart, ProductCart
 from product.models import Product
 from order.models import Order, OrderStatus
+from order import statuses
 from main.models import Customer
+from product.cache import get_catalog_version
+from product.models import StockReservation
+from product.reservations import hold, hold_cart
+from .cache import get_cart_version, bump_cart, resolve_active_cart_id, forget_active_cart
+from .serializers import serialize_cart_lines
 import json
+import uuid
 
 @login_required
 @require_POST
@@ -16,8 +25,10 @@ def delete_cart(request):
     id = data['cart_id']
 
     try:
-        cart = Cart.objects.get(pk=id)
+        cart = Cart.objects.select_related('customer').get(pk=id)
+        # the pre_delete receivers give the held stock back
         cart.delete()
+        forget_active_cart(cart.customer.user_id)
         return JsonResponse({'message': 'success to delete cart'}, status=200)
     except Cart.DoesNotExist:
         return JsonResponse({'error': 'failed to delete, cannot find cart'}, status=400)
@@ -39,15 +50,11 @@ def delete_productcart(request):
 @login_required
 @permission_required('cart.view_productcart')
 def show_cart(request):
-    customer = request.user.customer
-    if not customer:
+    cart_id = resolve_active_cart_id(request.user)
+    if not cart_id:
         return JsonResponse({'status': 'failed to access cart page, you are not customer'})
 
-    cart = Cart.objects.filter(customer=customer, is_checked_out=False).order_by('created_at').first()
-    
-    if not cart:
-        cart = Cart.objects.create(customer=customer, is_checked_out=False)
-    return render(request, 'show_cart.html', context={'cart_id': str(cart.id), 'is_customer': True})
+    return render(request, 'show_cart.html', context={'cart_id': str(cart_id), 'is_customer': True})
 
 @login_required
 @permission_required("cart.checkout_cart")
@@ -57,14 +64,19 @@ def checkout_cart(request):
     total = data['total']
 
     try:
-        status = OrderStatus.objects.filter(status='not paid').first()
+        not_paid_id = statuses.status_id(statuses.NOT_PAID)
         cart = Cart.objects.get(id=cart_id)
+        lines = ProductCart.objects.filter(cart=cart).values_list('product_id', 'quantity')
+        if hold_cart(cart.id, lines):
+            return JsonResponse({'message': 'Out of stock'}, status=400)
+
         cart.is_checked_out = True
         cart.save()
+        forget_active_cart(request.user.id)
 
         Order.objects.create(
             cart=cart,
-            status_id=status.id,
+            status_id=not_paid_id,
             total=total
         )
 
@@ -75,46 +87,42 @@ def checkout_cart(request):
         return JsonResponse({'message': 'fail'})
     
 
+def cart_etag(request, id):
+    # cart lines embed product stock and price, so both versions are part of the tag
+    try:
+        cart_version = get_cart_version(id)
+    except ValueError:
+        # not a cart id, the view answers it
+        return None
+    return f'cart-{cart_version}-{get_catalog_version()}'
+
 @login_required
 @permission_required('cart.view_cart')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=cart_etag)
 def view_cart(request, id):
     try:
         cart = Cart.objects.get(pk=id)
-        product_carts = ProductCart.objects.filter(cart_id=cart)
-    
-        product_carts_json = [
-            {
-                'product' : {
-                    'product_id': product_cart.product.id,
-                    'product_name': product_cart.product.product_name,
-                    'product_stock': product_cart.product.stock,
-                    'product_price': product_cart.product.price,
-                    'product_description': product_cart.product.description
-                },
-                'id': product_cart.id,
-                'quantity': product_cart.quantity,
-            } for product_cart in product_carts
-        ]
-        print(product_carts)
-        return JsonResponse({'product_carts': product_carts_json})
+        product_carts_json, total = serialize_cart_lines(cart.id)
+        return JsonResponse({'product_carts': product_carts_json, 'total': total})
     except Cart.DoesNotExist:
-        print('error')
         return JsonResponse({'status': 'cannot get cart object with such uuid'})
 
-
 @login_required
 @permission_required("cart.change_cart")
 def edit_product_in_cart(request):
     data = json.loads(request.body)
     try:
-        product_cart = data['product_cart_id']
-        product_cart = ProductCart.objects.get(id=product_cart)
+        product_cart_id = data['product_cart_id']
+        product_cart = ProductCart.objects.get(id=product_cart_id)
         product_cart_quantity = int(data['amount'])
 
         if product_cart_quantity == 0:
             product_cart.delete()
-        elif product_cart_quantity < 0 or product_cart_quantity > product_cart.product.stock:
-            return JsonResponse({'message': f'product quantity must be greater than 0 and less than {product_cart.product.stock}'}, status=400)
+            return JsonResponse({"product_cart": product_cart_id, 'message': 'success'}, status=200)
+        elif product_cart_quantity < 0 or not hold(product_cart.cart_id, product_cart.product_id, product_cart_quantity):
+            stock = product_cart.product.available_stock + product_cart.quantity
+            return JsonResponse({'message': f'product quantity must be greater than 0 and less than {stock}'}, status=400)
 
         product_cart.quantity = product_cart_quantity
         product_cart.save()
@@ -136,26 +144,144 @@ def add_product_to_cart(request):
         if amount < 1:
             return JsonResponse({'message': 'Amount has to be positive integer'}, status=400) 
 
-        customer = Customer.objects.get(user=request.user)
+        cart_id = resolve_active_cart_id(request.user)
+        if not cart_id:
+            return JsonResponse({'message': 'only customer could access this resource!'}, status=400)
 
-        cart = Cart.objects.filter(customer=customer, is_checked_out=False).first()
-        if not cart:
-            cart = Cart.objects.create(customer=customer)
+        # the line and its hold are written together or not at all
+        with transaction.atomic():
+            product_cart, created = ProductCart.objects.get_or_create(cart_id=cart_id, product=product)
+            product_quantity = product_cart.quantity
+            product_quantity += amount
 
-        product_cart, created = ProductCart.objects.get_or_create(cart=cart, product=product)
-        product_quantity = product_cart.quantity
-        product_quantity += amount
+            if not hold(cart_id, product.id, product_quantity):
+                transaction.set_rollback(True)
+                return JsonResponse({'message': 'Out of stock'}, status=400)
 
-        if product_quantity > product.stock:
-            if product_cart.quantity <= 0:
-                product_cart.delete()
-            return JsonResponse({'message': 'Out of stock'}, status=400)
-
-        product_cart.quantity = product_quantity 
-        product_cart.save()
+            product_cart.quantity = product_quantity 
+            product_cart.save()
 
         return JsonResponse({'message': 'success'}, status=200)
 
     except Product.DoesNotExist:
         return JsonResponse({'message': 'Product does not exist'}, status=400)
 
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+def apply_cart_operations(cart_id, operations):
+    """
+    Apply a list of {'op', 'product_id', 'amount'} operations to the cart in one
+    transaction. Returns a list of errors, nothing is written when it is not empty.
+    """
+    errors = []
+    product_ids = []
+    for operation in operations:
+        try:
+            product_ids.append(uuid.UUID(str(operation.get('product_id'))))
+        except ValueError:
+            product_ids.append(None)
+            errors.append({'product_id': operation.get('product_id'), 'message': 'Product does not exist'})
+    if errors:
+        return errors
+
+    with transaction.atomic():
+        # stock that is free for this cart: unreserved stock plus what the cart already holds
+        stocks = {
+            product_id: stock - reserved
+            for product_id, stock, reserved in Product.objects.filter(id__in=product_ids).values_list('id', 'stock', 'reserved')
+        }
+        for product_id, quantity in StockReservation.objects.filter(cart_id=cart_id, product_id__in=stocks.keys()).values_list('product_id', 'quantity'):
+            stocks[product_id] += quantity
+        lines = {
+            line.product_id: line
+            for line in ProductCart.objects.filter(cart_id=cart_id, product_id__in=stocks.keys())
+        }
+
+        quantities = {product_id: line.quantity for product_id, line in lines.items()}
+        for operation, product_id in zip(operations, product_ids):
+            op = operation.get('op')
+            if op not in CART_OPERATIONS:
+                errors.append({'product_id': product_id, 'message': f'unknown operation {op}'})
+                continue
+            if product_id not in stocks:
+                errors.append({'product_id': product_id, 'message': 'Product does not exist'})
+                continue
+            try:
+                amount = int(operation.get('amount', 0))
+            except (TypeError, ValueError):
+                errors.append({'product_id': product_id, 'message': 'Amount has to be an integer'})
+                continue
+
+            if op == 'add':
+                if amount < 1:
+                    errors.append({'product_id': product_id, 'message': 'Amount has to be positive integer'})
+                    continue
+                quantities[product_id] = quantities.get(product_id, 0) + amount
+            elif op == 'set':
+                if amount < 0:
+                    errors.append({'product_id': product_id, 'message': 'Amount cannot be negative'})
+                    continue
+                quantities[product_id] = amount
+            else:
+                quantities[product_id] = 0
+
+        for product_id, quantity in quantities.items():
+            if quantity > stocks[product_id]:
+                errors.append({'product_id': product_id, 'message': 'Out of stock'})
+        if errors:
+            return errors
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            line = lines.get(product_id)
+            if line is None:
+                if quantity > 0:
+                    to_create.append(ProductCart(cart_id=cart_id, product_id=product_id, quantity=quantity))
+            elif quantity == 0:
+                to_delete.append(line.id)
+            elif quantity != line.quantity:
+                line.quantity = quantity
+                to_update.append(line)
+
+        # the conditional holds are the real guard against a concurrent cart taking the stock
+        for product_id, quantity in quantities.items():
+            if quantity == 0 and product_id in lines:
+                # deleting the line releases its hold
+                continue
+            if not hold(cart_id, product_id, quantity):
+                transaction.set_rollback(True)
+                return [{'product_id': product_id, 'message': 'Out of stock'}]
+
+        ProductCart.objects.bulk_create(to_create)
+        ProductCart.objects.bulk_update(to_update, ['quantity'])
+        if to_delete:
+            ProductCart.objects.filter(id__in=to_delete).delete()
+        # bulk writes skip the model signals
+        bump_cart(cart_id)
+    return []
+
+@login_required
+@require_POST
+@permission_required(['cart.add_productcart', 'cart.change_cart'])
+def batch_update_cart(request):
+    try:
+        data = json.loads(request.body)
+        operations = data['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'message': 'operations is required'}, status=400)
+    if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+        return JsonResponse({'message': 'operations must be a list'}, status=400)
+    # removing lines needs the same permission as delete_productcart
+    if any(operation.get('op') == 'remove' for operation in operations) and not request.user.has_perm('cart.delete_productcart'):
+        return JsonResponse({'message': 'you are not allowed to remove products from the cart'}, status=403)
+
+    cart_id = resolve_active_cart_id(request.user)
+    if not cart_id:
+        return JsonResponse({'message': 'only customer could access this resource!'}, status=400)
+
+    errors = apply_cart_operations(cart_id, operations)
+    if errors:
+        return JsonResponse({'message': 'failed to update cart', 'errors': errors}, status=400)
+
+    product_carts_json, total = serialize_cart_lines(cart_id)
+    return JsonResponse({'cart_id': cart_id, 'product_carts': product_carts_json, 'total': total})
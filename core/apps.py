@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_save, post_delete
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from .roles import groups_changed, profile_changed
+        from . import checks  # registers the deploy checks
+        m2m_changed.connect(groups_changed, sender=User.groups.through)
+        for model in ('main.Admin', 'main.Worker', 'main.Customer'):
+            post_save.connect(profile_changed, sender=model)
+            post_delete.connect(profile_changed, sender=model)
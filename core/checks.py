@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # cache versions and the PIN throttle must be seen by every worker process
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache'):
+        return [Warning(
+            'The default cache is local to each process.',
+            hint='Set REDIS_URL so cache versions and throttles are shared between worker processes.',
+            id='core.W001',
+        )]
+    return []
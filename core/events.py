@@ -0,0 +1,153 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """
+    Events for one listener. The broker may publish from any thread, the listener
+    waits either blocking (WSGI) or on its event loop (ASGI).
+    """
+
+    def __init__(self, channels):
+        self.channels = tuple(channels)
+        self._events = queue.SimpleQueue()
+        self._loop = None
+        self._wakeup = None
+
+    def put(self, event):
+        self._events.put(event)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def get(self, timeout):
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        if self._loop is None:
+            self._wakeup = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        try:
+            return self._events.get_nowait()
+        except queue.Empty:
+            pass
+        self._wakeup.clear()
+        # an event published between the check and clear() must not be missed
+        try:
+            return self._events.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self._events.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    # in-process pub/sub, only listeners of the same process receive an event
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                listeners = self._channels.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._channels[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscription in listeners:
+            subscription.put(event)
+        return len(listeners)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    # settings.EVENT_BROKER names the class, swap it for one backed by a real broker
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENT_BROKER)()
+    return _broker
+
+def publish(channel, event_type, data):
+    return get_broker().publish(channel, {'event': event_type, 'data': data})
+
+def format_event(event):
+    payload = json.dumps(event['data'], cls=DjangoJSONEncoder)
+    return f"event: {event['event']}\ndata: {payload}\n\n"
+
+# how soon the browser reconnects after a WSGI long-poll response ends, in milliseconds
+POLL_RETRY_MS = 500
+
+def _sync_stream(channels, seconds):
+    # a long-poll: the first event (plus any queued with it) or nothing after `seconds`
+    broker = get_broker()
+    subscription = broker.subscribe(channels)
+    try:
+        yield f'retry: {POLL_RETRY_MS}\n\n'
+        event = subscription.get(timeout=seconds)
+        while event:
+            yield format_event(event)
+            event = subscription.get(timeout=0)
+    finally:
+        broker.unsubscribe(subscription)
+
+async def _async_stream(channels, seconds, keepalive):
+    broker = get_broker()
+    subscription = broker.subscribe(channels)
+    deadline = time.monotonic() + seconds
+    try:
+        yield f'retry: {keepalive * 1000}\n\n'
+        while time.monotonic() < deadline:
+            event = await subscription.aget(timeout=min(keepalive, max(0, deadline - time.monotonic())))
+            yield format_event(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+def event_stream(request, channels):
+    """
+    Server-sent events response for `channels`, the browser's EventSource reconnects
+    whenever it closes. Under ASGI the stream stays open for EVENT_STREAM_SECONDS and
+    waiting touches neither the database nor a thread. Under WSGI every open stream
+    pins a worker, so it ends after the first event or EVENT_POLL_SECONDS.
+    """
+    if isinstance(request, ASGIRequest):
+        content = _async_stream(channels, settings.EVENT_STREAM_SECONDS, settings.EVENT_KEEPALIVE_SECONDS)
+    else:
+        content = _sync_stream(channels, settings.EVENT_POLL_SECONDS)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
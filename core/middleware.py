@@ -0,0 +1,25 @@
+from django.utils.functional import SimpleLazyObject
+from .roles import resolve_identity
+
+
+def _get_identity(request):
+    if not hasattr(request, '_cached_identity'):
+        request._cached_identity = resolve_identity(request)
+    return request._cached_identity
+
+
+class RoleMiddleware:
+    """
+    Sets request.role and request.profile (the user's Admin, Worker or Customer row,
+    or None). Both resolve on first use, at most once per request, and are usually
+    answered from the session. Compare the role with ==, and test the profile with
+    isinstance() or truthiness since it is a lazy proxy and never `is None`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: _get_identity(request)[0])
+        request.profile = SimpleLazyObject(lambda: _get_identity(request)[1])
+        return self.get_response(request)
@@ -0,0 +1,78 @@
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, rows within the same
+    # millisecond as the cursor would be skipped
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    # cursor is opaque to the client, anything we cannot read back is rejected
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor')
+    return values
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, maximum))
+
+def _cursor_value(row, field):
+    if isinstance(row, dict):
+        return row[field]
+    for part in field.split('__'):
+        row = getattr(row, part)
+    return row
+
+def keyset_page(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for the page after `cursor`.
+    `ordering` must end with a unique field so the order is stable, prefix a
+    field with '-' for descending order. Only one extra row is fetched to know
+    whether another page exists, so the cost is bounded by `page_size`.
+    """
+    fields = [field.lstrip('-') for field in ordering]
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError('invalid cursor')
+        after = Q()
+        for i, field in enumerate(fields):
+            lookup = 'lt' if ordering[i].startswith('-') else 'gt'
+            condition = Q(**{fields[j]: values[j] for j in range(i)})
+            condition &= Q(**{f'{field}__{lookup}': values[i]})
+            after |= condition
+        try:
+            queryset = queryset.filter(after)
+        except (ValidationError, TypeError):
+            raise ValueError('invalid cursor')
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(_cursor_value(rows[-1], field) for field in fields)
+    return rows, next_cursor
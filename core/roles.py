@@ -0,0 +1,101 @@
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Max
+from .versioning import get_version, bump_version
+
+SESSION_KEY = '_identity'
+NO_ROLE = 'hey you mfs'
+# the first profile found wins, admin over worker over customer
+PROFILE_FIELDS = ['admin', 'worker', 'customer']
+
+
+def role_for_groups(count, name):
+    if count == 1:
+        if name == 'Admin':
+            return 'Admin'
+        elif name == 'Customer':
+            return 'Customer'
+        else:
+            return 'Worker'
+    return NO_ROLE
+
+def _version_key(user_id):
+    return f'user:{user_id}:identity:version'
+
+def bump_identity(user_id):
+    bump_version(_version_key(user_id))
+
+def _dump(profile):
+    # session data is plain JSON, UUIDs and dates go in as strings
+    values = {}
+    for field in profile._meta.concrete_fields:
+        value = field.value_from_object(profile)
+        values[field.attname] = value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+    return [profile._meta.label, values]
+
+def _restore(dumped):
+    label, values = dumped
+    model = apps.get_model(label)
+    fields = model._meta.concrete_fields
+    return model.from_db('default', [field.attname for field in fields], [field.to_python(values[field.attname]) for field in fields])
+
+def _load(user):
+    """
+    The user's role and profile in one query: the group count and name are
+    aggregated next to the profile rows joined in by select_related.
+    """
+    row = User.objects.filter(pk=user.pk).select_related(*PROFILE_FIELDS).annotate(
+        group_count=Count('groups', distinct=True), group_name=Max('groups__name'),
+    ).first()
+    if row is None:
+        return NO_ROLE, None
+    profile = None
+    for field in PROFILE_FIELDS:
+        try:
+            profile = getattr(row, field)
+            break
+        except ObjectDoesNotExist:
+            continue
+    return role_for_groups(row.group_count, row.group_name), profile
+
+def resolve_identity(request):
+    """
+    (role, profile) of the request's user. The session keeps the last answer
+    together with the user's identity version, a group or profile change bumps the
+    version and the next request reloads it. The version lives in the cache, which
+    must be shared by every process that changes groups or profiles (see CACHES).
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return NO_ROLE, None
+
+    version = get_version(_version_key(user.pk))
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached.get('user') == user.pk and cached.get('version') == version:
+        return cached['role'], _restore(cached['profile']) if cached['profile'] else None
+
+    role, profile = _load(user)
+    request.session[SESSION_KEY] = {
+        'user': user.pk,
+        'version': version,
+        'role': role,
+        'profile': _dump(profile) if profile is not None else None,
+    }
+    return role, profile
+
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_identity(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            bump_identity(user_id)
+    else:
+        # a group was cleared of all its users
+        for user_id in instance.user_set.values_list('id', flat=True):
+            bump_identity(user_id)
+
+def profile_changed(sender, instance, **kwargs):
+    bump_identity(instance.user_id)
@@ -1,3 +1,94 @@
-from django.test import TestCase
+import asyncio
+import threading
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from main.models import Customer, Worker
+from .checks import check_shared_cache
+from .events import LocalBroker, format_event, get_broker, _sync_stream
+from .middleware import RoleMiddleware
 
-# Create your tests here.
+
+class LocalBrokerTests(SimpleTestCase):
+
+    def test_publish_reaches_channel_subscribers_only(self):
+        broker = LocalBroker()
+        jaksel = broker.subscribe(['dispatch:jaksel'])
+        depok = broker.subscribe(['dispatch:depok'])
+
+        self.assertEqual(broker.publish('dispatch:jaksel', {'event': 'order-ready', 'data': {'order_id': 1}}), 1)
+        self.assertEqual(jaksel.get(timeout=0)['data'], {'order_id': 1})
+        self.assertIsNone(depok.get(timeout=0))
+
+        broker.unsubscribe(jaksel)
+        self.assertEqual(broker.publish('dispatch:jaksel', {'event': 'order-ready', 'data': {}}), 0)
+
+    def test_async_listener_wakes_on_publish_from_another_thread(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(['dispatch'])
+
+        async def listen():
+            threading.Timer(0.05, broker.publish, args=('dispatch', {'event': 'order-taken', 'data': {'order_id': 2}})).start()
+            return await subscription.aget(timeout=5)
+
+        event = asyncio.run(listen())
+        self.assertEqual(format_event(event), 'event: order-taken\ndata: {"order_id": 2}\n\n')
+
+    def test_wsgi_stream_ends_after_the_first_events(self):
+        stream = _sync_stream(['order:1'], 5)
+        self.assertEqual(next(stream), 'retry: 500\n\n')
+        get_broker().publish('order:1', {'event': 'status', 'data': {'status': 'paid'}})
+        get_broker().publish('order:1', {'event': 'status', 'data': {'status': 'prepared'}})
+        self.assertEqual(len(list(stream)), 2)
+
+
+class RoleMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='courier', password='password123')
+        self.user.groups.add(Group.objects.create(name='Worker'))
+        self.worker = Worker.objects.create(user=self.user, domicile='jaksel')
+        self.session = SessionStore()
+
+    def get(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = self.session
+        return RoleMiddleware(lambda request: request)(request)
+
+    def test_role_and_profile_load_in_one_query_then_come_from_the_session(self):
+        with self.assertNumQueries(1):
+            request = self.get()
+            self.assertEqual(request.role, 'Worker')
+            self.assertIsInstance(request.profile, Worker)
+
+        with self.assertNumQueries(0):
+            request = self.get()
+            self.assertEqual(request.role, 'Worker')
+            self.assertEqual(request.profile, self.worker)
+            self.assertEqual(request.profile.domicile, 'jaksel')
+
+    def test_group_change_reloads_the_role(self):
+        self.assertEqual(self.get().role, 'Worker')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.set([Group.objects.create(name='Customer')])
+            self.worker.delete()
+            Customer.objects.create(user=self.user)
+
+        request = self.get()
+        self.assertEqual(request.role, 'Customer')
+        self.assertIsInstance(request.profile, Customer)
+
+
+class CacheSettingsTests(SimpleTestCase):
+
+    def test_suite_runs_on_its_own_local_cache(self):
+        self.assertEqual(type(caches['default']).__name__, 'LocMemCache')
+
+    def test_deploy_check_warns_about_a_per_process_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['core.W001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,21 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so a lost counter never reuses an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+def bump_version(key):
+    # wait for the write to be visible before readers can see the new version
+    transaction.on_commit(lambda: _bump(key))
@@ -1,11 +1,6 @@
+from .roles import role_for_groups
+
 def get_user_role(user):
-    user_group = user.groups.values_list('name', flat='True')
-    if len(user_group) == 1:
-        if user_group[0] == 'Admin':
-            return 'Admin'
-        elif user_group[0] == 'Customer':
-            return 'Customer'
-        else:
-            return 'Worker'
-    else:
-        return 'hey you mfs'
+    # views read request.role instead, see core.middleware.RoleMiddleware
+    user_group = list(user.groups.values_list('name', flat=True)[:2])
+    return role_for_groups(len(user_group), user_group[0] if user_group else None)
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +90,28 @@ DATABASES = {
     }
 }
 
+# Cache versions (user roles, the catalog, wallet sessions) are bumped by one process
+# and read by every other one, and the version counters and the wallet PIN throttle
+# rely on atomic incr/add. Deployments running more than one process must set
+# REDIS_URL, the LocMemCache fallback is atomic but only seen by its own process,
+# which is enough for runserver and the test run (see core.checks).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# tests get their own cache so they never share entries with a running server
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,3 +156,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 RECAPTCHA_PUBLIC_KEY = '6LeyMhcrAAAAAMdB972XAU8iyfyw76W5bMmPgX7E'
 RECAPTCHA_PRIVATE_KEY = '6LeyMhcrAAAAAI1maakIABNPyQbxPPjXqQ8RnOri'
+
+PRODUCT_CATALOG_PAGE_SIZE = 24
+
+# stock reservation holds, see product/reservations.py
+CART_HOLD_MINUTES = 15
+CHECKOUT_HOLD_MINUTES = 30
+
+# wallet PIN hashing and payment authorization, see wallet/tokens.py
+WALLET_PIN_HASHER = 'default'
+WALLET_PAYMENT_TOKEN_SECONDS = 600
+# entries a wallet may collect before a debit writes a new balance checkpoint
+WALLET_CHECKPOINT_EVERY = 100
+
+# wallet PIN attempts, see wallet/throttle.py
+WALLET_PIN_MAX_ATTEMPTS = 3
+WALLET_PIN_WINDOW_SECONDS = 600
+WALLET_PIN_LOCKOUT_SECONDS = 600
+
+# most ready orders one worker may claim in a single bulk claim
+WORKER_MAX_BULK_CLAIM = 10
+
+# server-sent events, see core/events.py
+EVENT_BROKER = 'core.events.LocalBroker'
+EVENT_STREAM_SECONDS = 300
+EVENT_KEEPALIVE_SECONDS = 15
+# under WSGI a stream holds a worker, so it returns after one event or this long
+EVENT_POLL_SECONDS = 20
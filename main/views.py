@@ -8,36 +8,29 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse
 from .forms import AdminRegistrationForm, CustomerRegistrationForm, WorkerRegistrationForm, LoginForm
+from wallet.tokens import revoke_session_token
 from django.template.loader import render_to_string
+from .models import Admin, Customer, Worker
 
 @login_required(login_url='/login')
 def show_main_page(request): 
     context = {'user': request.user}
-    try:
-        customer = request.user.customer
+    profile = request.profile
+    if isinstance(profile, Admin):
         context = {
-            'customer': request.user.customer,
-            'is_customer': True
+            'admin': profile,
+            'is_admin': True,
         }
-    except:
-        print('not customer')
-    try:
-        worker = request.user.worker
+    elif isinstance(profile, Worker):
         context = {
-            'worker': request.user.worker,
+            'worker': profile,
             'is_worker': True
         }
-    except:
-        print('not worker')
-
-    try:
-        admin = request.user.admin
+    elif isinstance(profile, Customer):
         context = {
-            'admin': request.user.admin,
-            'is_admin': True,
+            'customer': profile,
+            'is_customer': True
         }
-    except:
-        print('not admin')
 
     return render(request, 'home.html', context)
 
@@ -97,5 +90,6 @@ def worker_register(request):
     return render(request, 'register_customer.html',{'form': form})
 
 def logout_user(request):
+    revoke_session_token(request.session.get('walletSession'))
     logout(request)
     return redirect('main:home')
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class OrderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'order'
+
+    def ready(self):
+        from .statuses import reset_registry
+        from .transitions import status_changed, publish_status
+        post_save.connect(reset_registry, sender='order.OrderStatus')
+        post_delete.connect(reset_registry, sender='order.OrderStatus')
+        status_changed.connect(publish_status)
@@ -0,0 +1,98 @@
+import threading
+import time
+from types import MappingProxyType
+from .models import OrderStatus
+
+NOT_PAID = 'not paid'
+PAID = 'paid'
+PREPARED = 'prepared'
+READY = 'ready'
+DELIVERED = 'delivered'
+COMPLETED = 'completed'
+REVIEWED = 'reviewed'
+CANCELLED = 'cancelled'
+
+# colours of the order detail status badge and card header, the badge map is also
+# sent to the page so live status updates recolour it the same way
+BADGE_CLASSES = {
+    NOT_PAID: 'bg-yellow-200 text-yellow-800',
+    PAID: 'bg-blue-200 text-blue-800',
+    PREPARED: 'bg-blue-800 text-white',
+    READY: 'bg-green-800 text-white',
+    DELIVERED: 'bg-green-800 text-white',
+    COMPLETED: 'bg-gray-900 text-white',
+    REVIEWED: 'bg-gray-800 text-white',
+    CANCELLED: 'bg-red-800 text-white',
+}
+HEADER_CLASSES = {
+    NOT_PAID: 'bg-warning',
+    PAID: 'bg-info',
+    PREPARED: 'bg-primary text-white',
+    READY: 'bg-success text-white',
+    DELIVERED: 'bg-success text-white',
+    COMPLETED: 'bg-dark text-white',
+    REVIEWED: 'bg-secondary text-white',
+    CANCELLED: 'bg-danger text-white',
+}
+
+# a lookup miss reloads the table at most this often, unknown ids must not cost a query each
+MISS_RELOAD_SECONDS = 30
+
+
+class StatusRegistry:
+    """
+    Immutable name <-> id view of the OrderStatus table. One instance is loaded per
+    process on first use and swapped out whenever an OrderStatus row changes.
+    """
+
+    def __init__(self, rows):
+        self.ids = MappingProxyType({name: status_id for name, status_id in rows})
+        self.names = MappingProxyType({status_id: name for name, status_id in rows})
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        return cls(list(OrderStatus.objects.values_list('status', 'id')))
+
+
+_registry = None
+_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    registry = _registry
+    if registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = StatusRegistry.load()
+            registry = _registry
+    return registry
+
+def reset_registry(**kwargs):
+    global _registry
+    _registry = None
+
+def _reload_after_miss(registry):
+    # the table may have been seeded by another process after the registry was loaded,
+    # changes made in this process already reset it through the OrderStatus signals
+    global _registry
+    with _lock:
+        if _registry is registry and time.monotonic() - registry.loaded_at >= MISS_RELOAD_SECONDS:
+            _registry = StatusRegistry.load()
+    return get_registry()
+
+def status_id(name):
+    registry = get_registry()
+    if name not in registry.ids:
+        registry = _reload_after_miss(registry)
+    try:
+        return registry.ids[name]
+    except KeyError:
+        raise OrderStatus.DoesNotExist(f'order status {name!r} does not exist')
+
+def status_name(id):
+    registry = get_registry()
+    if id not in registry.names:
+        registry = _reload_after_miss(registry)
+    return registry.names.get(id)
@@ -1,4 +1,5 @@
 from django import template
+from order import statuses
 
 register = template.Library()
 
@@ -10,3 +11,13 @@ def multiply(value, arg):
     except (ValueError, TypeError):
         return 0
 
+
+@register.filter
+def status_badge_class(status):
+    """Badge colour classes for an order status name"""
+    return statuses.BADGE_CLASSES.get(status, '')
+
+@register.filter
+def status_header_class(status):
+    """Card header colour classes for an order status name"""
+    return statuses.HEADER_CLASSES.get(status, '')
@@ -0,0 +1,87 @@
+import uuid
+from django.db import transaction
+from django.dispatch import Signal
+from core import events
+from .models import Order, OrderStatus
+from . import statuses
+
+TRANSITIONS = {
+    statuses.NOT_PAID: (statuses.PAID, statuses.CANCELLED),
+    statuses.PAID: (statuses.PREPARED, statuses.CANCELLED),
+    statuses.PREPARED: (statuses.READY, statuses.CANCELLED),
+    statuses.READY: (statuses.DELIVERED,),
+    statuses.DELIVERED: (statuses.COMPLETED,),
+    statuses.COMPLETED: (statuses.REVIEWED,),
+}
+
+# sent after the transaction commits, with order_id, from_status and to_status (names)
+status_changed = Signal()
+
+
+def order_channel(order_id):
+    # ids come in as UUIDs or as strings from URLs, both map to one channel
+    return f'order:{uuid.UUID(str(order_id))}'
+
+def publish_status(sender, order_id, to_status, **kwargs):
+    # pushes the new status to anyone watching the order's detail page
+    events.publish(order_channel(order_id), 'status', {'order_id': order_id, 'status': to_status})
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+def sources(to_status):
+    return [from_status for from_status, targets in TRANSITIONS.items() if to_status in targets]
+
+def transition(order, to_status):
+    """
+    Move an order to `to_status` with a single compare-and-set UPDATE. When given an
+    Order instance the update only applies if the row still has the status that was
+    read, otherwise any status with an edge to `to_status` is accepted. Returns
+    False when the edge is not allowed or another request moved the order first.
+    """
+    if isinstance(order, Order):
+        order_id = order.id
+        from_status = statuses.status_name(order.status_id)
+        if not can_transition(from_status, to_status):
+            return False
+        from_ids = [order.status_id]
+    else:
+        order_id = order
+        from_status = None
+        from_ids = []
+        for name in sources(to_status):
+            try:
+                from_ids.append(statuses.status_id(name))
+            except OrderStatus.DoesNotExist:
+                continue
+
+    to_id = statuses.status_id(to_status)
+    updated = Order.objects.filter(id=order_id, status_id__in=from_ids).update(status_id=to_id)
+    if updated != 1:
+        return False
+
+    if isinstance(order, Order):
+        order.status_id = to_id
+    transaction.on_commit(lambda: status_changed.send(
+        sender=Order, order_id=order_id, from_status=from_status, to_status=to_status,
+    ))
+    return True
+
+def transition_many(order_ids, from_status, to_status):
+    """
+    Move every order in `order_ids` from `from_status` to `to_status` with one UPDATE.
+    Returns the number of orders moved, callers that need all of them compare it
+    with len(order_ids).
+    """
+    order_ids = list(order_ids)
+    if not order_ids or not can_transition(from_status, to_status):
+        return 0
+    updated = Order.objects.filter(id__in=order_ids, status_id=statuses.status_id(from_status)).update(
+        status_id=statuses.status_id(to_status),
+    )
+
+    def notify():
+        for order_id in order_ids:
+            status_changed.send(sender=Order, order_id=order_id, from_status=from_status, to_status=to_status)
+    transaction.on_commit(notify)
+    return updated
@@ -1,12 +1,14 @@
 from django.urls import path
-from .views import show_order, order_detail, cancel_order, show_order_customer, show_order_worker, show_order_admin
+from .views import show_order, order_detail, cancel_order, show_order_customer, show_order_worker, show_order_admin, customer_order_page, order_status_events
 app_name = 'order'
 
 urlpatterns = [
     path('order-customer', show_order_customer, name="show_order"),
     path('order-worker', show_order_worker, name='show_order_worker'),
     path('order-admin', show_order_admin, name='show_order_admin'),
+    path('order-customer/page', customer_order_page, name='customer_order_page'),
     path('order-gateway', show_order, name='order_gateway'),
     path('<str:id>/', order_detail, name='order_detail'),
     path('<str:id>/cancel/', cancel_order, name='cancel_order'),
+    path('<str:id>/events/', order_status_events, name='order_status_events'),
 ]
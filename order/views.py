@@ -5,46 +5,48 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.views.decorators.http import require_POST
 from main.models import Customer
 from cart.models import ProductCart, Cart
+from cart.serializers import serialize_cart_lines
+from product.models import Product
+from product.cache import bump_catalog_version
+from product.reservations import release_cart
+from django.db.models import F, Count, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+from core.pagination import encode_cursor, keyset_page
 from .models import Order, OrderStatus
-from wallet.models import WalletAccount, Wallet, OrderPayment
+from . import statuses
+from .transitions import transition, order_channel
+from core.events import event_stream
+from django.db import transaction
+from wallet.models import WalletAccount, Wallet, OrderPayment, WalletEntry
+from wallet import ledger
+from worker.dispatch import feed_for
 import json, uuid
-from core.views import get_user_role
 from django.http import JsonResponse
 
-NOT_PAID_STATUS_ID = '11111111111111111111111111111111'
-PAID_STATUS_ID = '22222222222222222222222222222222'
-PREPARED_STATUS_ID = '33333333333333333333333333333333'
-READY_STATUS_ID = '44444444444444444444444444444444'
-DELIVERED_STATUS_ID = '55555555555555555555555555555555'
-COMPLETED_STATUS_ID = '66666666666666666666666666666666'
-REVIEWED_STATUS_ID = '77777777777777777777777777777777'
-CANCELLED_STATUS_ID = '88888888888888888888888888888888'
-
-def update_wallet_ballance(wallet, amount):
-    wallet.saldo = amount
-    wallet.save()
 
 def update_product(cart):
-    product_carts = ProductCart.objects.filter(cart=cart)
-    for product_cart in product_carts:
-        product_cart.product.stock += product_cart.quantity
-        product_cart.product.save()
+    # puts the sold stock back with F() so concurrent sales are not lost
+    product_carts = ProductCart.objects.filter(cart=cart).values_list('product_id', 'quantity')
+    for product_id, quantity in product_carts:
+        Product.objects.filter(id=product_id).update(stock=F('stock') + quantity)
+    bump_catalog_version()
 
 @login_required
 def show_order(request):
     context = {'user': request.user}
-    if get_user_role(request.user) == 'Customer':
+    if request.role == 'Customer':
         return redirect('order:show_order')
-    elif get_user_role(request.user) == 'Worker':
+    elif request.role == 'Worker':
         return redirect('order:show_order_worker')
-    elif get_user_role(request.user) == 'Admin':
+    elif request.role == 'Admin':
         return redirect('order:show_order_admin')
     return render(request, 'show_order.html', context)
 
 @login_required
 def show_order_admin(request):
 
-    if get_user_role(request.user) == 'Admin':
+    if request.role == 'Admin':
         available_orders = OrderPayment.objects.filter(order__status__status='paid')
         prepared_orders = OrderPayment.objects.filter(order__status__status='prepared')
         reviewed_orders = OrderPayment.objects.filter(order__status__status='reviewed')
@@ -60,10 +62,10 @@ def show_order_admin(request):
         
 @login_required
 def show_order_worker(request):
-    if get_user_role(request.user) == 'Worker':
-        available_orders = OrderPayment.objects.filter(worker__isnull=True, order__status__status='ready')
-        delivered_orders = OrderPayment.objects.filter(worker=request.user.worker, order__status__status='delivered') 
-        completed_orders = OrderPayment.objects.filter(worker=request.user.worker, order__status__status='completed')
+    if request.role == 'Worker':
+        available_orders = feed_for(request.profile)
+        delivered_orders = OrderPayment.objects.filter(worker=request.profile, order__status__status='delivered') 
+        completed_orders = OrderPayment.objects.filter(worker=request.profile, order__status__status='completed')
         context = {
             'available_orders': available_orders,
             'delivered_orders': delivered_orders,
@@ -74,84 +76,131 @@ def show_order_worker(request):
     else:
         return JsonResponse({'message' : 'only worker could access this resource!'}, status=400)
 
+ORDER_BUCKET_PAGE_SIZE = 10
+ORDER_BUCKETS = [
+    # (status, title, header class, title class)
+    ('not paid', 'Not Paid Orders', 'bg-yellow-400', 'text-gray-800'),
+    ('paid', 'Paid Orders', 'bg-blue-300', 'text-gray-800'),
+    ('prepared', 'Prepared Orders', 'bg-blue-600', 'text-white'),
+    ('ready', 'Ready for Pickup Orders', 'bg-green-600', 'text-white'),
+    ('delivered', 'Delivered Orders', 'bg-green-600', 'text-white'),
+    ('completed', 'Completed Orders', 'bg-gray-800', 'text-white'),
+    ('reviewed', 'Reviewed Orders', 'bg-gray-600', 'text-white'),
+    ('cancelled', 'Cancelled Orders', 'bg-red-600', 'text-white'),
+]
+ORDER_BUCKET_ORDERING = ('-created_at', '-id')
+
 @login_required
 def show_order_customer(request):
-    if get_user_role(request.user) != 'Customer':
+    if request.role != 'Customer':
         return JsonResponse({'message' : 'only customer could access this resource!'}, status=400)
-    orders = Order.objects.filter(cart__customer=request.user.customer).select_related('status')
-    not_paid_orders = orders.filter(status__status='not paid')
-    paid_orders = orders.filter(status__status='paid')
-    prepared_orders = orders.filter(status__status='prepared')
-    ready_orders = orders.filter(status__status='ready')
-    delivered_orders = orders.filter(status__status='delivered')
-    completed_orders = orders.filter(status__status='completed')
-    reviewed_orders = orders.filter(status__status='reviewed')
-    cancelled_orders = orders.filter(status__status='cancelled')
+    orders = Order.objects.filter(cart__customer=request.profile)
+
+    # one GROUP BY for the bucket sizes and one windowed query for the first page of every bucket
+    counts = dict(orders.values_list('status__status').annotate(total=Count('id')))
+    first_pages = orders.annotate(
+        bucket_rank=Window(
+            RowNumber(),
+            partition_by=F('status_id'),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+    ).filter(bucket_rank__lte=ORDER_BUCKET_PAGE_SIZE).order_by(*ORDER_BUCKET_ORDERING)
+
+    bucket_orders = {}
+    for order in first_pages:
+        bucket_orders.setdefault(statuses.status_name(order.status_id), []).append(order)
+
+    order_buckets = []
+    for status, title, header_class, title_class in ORDER_BUCKETS:
+        page = bucket_orders.get(status, [])
+        next_cursor = None
+        if counts.get(status, 0) > len(page):
+            next_cursor = encode_cursor([page[-1].created_at, page[-1].id])
+        order_buckets.append({
+            'status': status,
+            'title': title,
+            'header_class': header_class,
+            'title_class': title_class,
+            'orders': page,
+            'count': counts.get(status, 0),
+            'next_cursor': next_cursor,
+        })
+
     context = {
-        'not_paid_orders': not_paid_orders,
-        'paid_orders': paid_orders,
-        'prepared_orders': prepared_orders,
-        'ready_orders': ready_orders,
-        'delivered_orders': delivered_orders,
-        'completed_orders': completed_orders,
-        'reviewed_orders': reviewed_orders,
-        'cancelled_orders': cancelled_orders,
+        'order_buckets': order_buckets,
+        'has_orders': bool(counts),
         'is_customer': True
     }
     return render(request, 'show_order.html', context)
 
+@login_required
+def customer_order_page(request):
+    if request.role != 'Customer':
+        return JsonResponse({'message' : 'only customer could access this resource!'}, status=400)
+    status = request.GET.get('status')
+    orders = Order.objects.filter(
+        cart__customer=request.profile, status__status=status
+    ).values('id', 'total', 'created_at')
+    try:
+        rows, next_cursor = keyset_page(orders, ORDER_BUCKET_ORDERING, request.GET.get('cursor'), ORDER_BUCKET_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'message': 'invalid cursor'}, status=400)
+
+    for row in rows:
+        row['url'] = reverse('order:order_detail', args=[row['id']])
+    return JsonResponse({'orders': rows, 'next_cursor': next_cursor})
+
 @login_required
 def order_detail(request, id):
-    order = Order.objects.get(pk=id)
-    product_carts = ProductCart.objects.filter(cart=order.cart)
+    order = Order.objects.select_related('status', 'cart').get(pk=id)
 
-    role = get_user_role(request.user)
+    role = request.role
     if role == 'Customer':
-        if order.cart.customer != request.user.customer:
+        if order.cart.customer != request.profile:
             return JsonResponse({'message': 'you are not belong to this order'}, status=400)
     elif role == 'Worker':
         try:
             worker = OrderPayment.objects.get(order=order).worker
-            if worker != request.user.worker:
+            if worker != request.profile:
                 return JsonResponse({'message': 'you are not belong to this order'}, status=400)
         except OrderPayment.DoesNotExist:
             return JsonResponse({'message': 'you are not belong this order'}, status=400)
 
-    product_carts_json = [
-        {
-            'product' : {
-                'product_id': product_cart.product.id,
-                'product_name': product_cart.product.product_name,
-                'product_stock': product_cart.product.stock,
-                'product_price': product_cart.product.price,
-                'product_description': product_cart.product.description
-            },
-            'id': product_cart.id,
-            'quantity': product_cart.quantity,
-        } for product_cart in product_carts
-    ]
+    product_carts_json, _ = serialize_cart_lines(order.cart_id)
     context = {
         'order': order,
         'cart_products': product_carts_json,
-        'can_cancel': str(order.status.status) in [
+        'can_cancel': statuses.status_name(order.status_id) in [
             'not paid',
             'paid',
-        ] and get_user_role(request.user) == 'Customer'
+        ] and role == 'Customer',
+        'badge_classes': statuses.BADGE_CLASSES,
     }
-    if get_user_role(request.user) == 'Worker':
+    if role == 'Worker':
         context['is_worker'] = True
-    elif get_user_role(request.user) == 'Customer':
+    elif role == 'Customer':
         context['is_customer'] = True
-    elif get_user_role(request.user) == 'Admin':
+    elif role == 'Admin':
         context['is_admin'] = True
     return render(request, 'show_order_details.html', context)
 
+@login_required
+def order_status_events(request, id):
+    # ownership is checked once when the stream opens, updates come from the broker
+    try:
+        channel = order_channel(id)
+    except ValueError:
+        return JsonResponse({'message': 'order is not exist'}, status=400)
+    if not Order.objects.filter(pk=id, cart__customer__user=request.user).exists():
+        return JsonResponse({'message': 'you are not belong to this order'}, status=400)
+    return event_stream(request, [channel])
+
 @login_required
 @permission_required('order.set_to_cancelled')
 def cancel_order(request, id):
     order = get_object_or_404(Order, id=id)
         
-    if order.cart.customer != request.user.customer:
+    if order.cart.customer != request.profile:
         return JsonResponse({'message' :'You don\'t have permission to cancel this order.' }, status=400)
     
     cancellable_statuses = [
@@ -159,17 +208,21 @@ def cancel_order(request, id):
         'paid',
     ]
     
-    if order.status.status not in cancellable_statuses:
+    if statuses.status_name(order.status_id) not in cancellable_statuses:
         return JsonResponse({'message' :'You don\'t have permission to cancel this order.' }, status=400)
 
-    if order.status.id == uuid.UUID(PAID_STATUS_ID):
-        update_product(order.cart)
-        wallet = Wallet.objects.get(walletAccount__user = request.user)
-        update_wallet_ballance(wallet, wallet.saldo+order.total)
+    with transaction.atomic():
+        was_paid = statuses.status_name(order.status_id) == statuses.PAID
+        if not transition(order, statuses.CANCELLED):
+            return JsonResponse({'message' :'You don\'t have permission to cancel this order.' }, status=400)
 
-    cancelled_status = OrderStatus.objects.get(id='88888888888888888888888888888888')
-    order.status = cancelled_status
-    order.save()
+        if was_paid:
+            update_product(order.cart)
+            wallet = Wallet.objects.get(walletAccount__user = request.user)
+            ledger.credit(wallet, order.total, WalletEntry.REFUND, order=order)
+        else:
+            # the checkout holds of an unpaid order go back to the catalog
+            release_cart(order.cart_id)
     
     messages.success(request, "Your order has been cancelled successfully.")
     return redirect('order:order_detail', id=id)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
 
 
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        from .search import ensure_search_index
+        from .cache import bump_catalog_version
+        post_migrate.connect(ensure_search_index, sender=self)
+        # every Product write (admin forms, stock updates on pay/cancel) bumps the catalog version
+        post_save.connect(bump_catalog_version, sender='product.Product')
+        post_delete.connect(bump_catalog_version, sender='product.Product')
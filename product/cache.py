@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import transaction
+from core.versioning import get_version, bump_version
+from .models import Product
+
+CATALOG_VERSION_KEY = 'product:catalog:version'
+# held units change on every cart click, they are overlaid on the cached catalog
+# instead of being part of the catalog version
+RESERVED_STOCK_KEY = 'product:reserved'
+RESERVED_STOCK_SECONDS = 10
+CATALOG_CACHE_TIMEOUT = 60 * 10
+LOCAL_CACHE_SIZE = 256
+# entries of an old catalog version are unreachable, the timeout only frees them sooner
+LOCAL_CACHE_SECONDS = 60
+
+
+class LRUCache:
+    def __init__(self, maxsize, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            expires_at, value = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+local_cache = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_SECONDS)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+def bump_catalog_version(**kwargs):
+    bump_version(CATALOG_VERSION_KEY)
+
+def get_reserved_stock():
+    # {product_id: reserved} of the products with held units
+    reserved = cache.get(RESERVED_STOCK_KEY)
+    if reserved is None:
+        reserved = dict(Product.objects.filter(reserved__gt=0).values_list('id', 'reserved'))
+        cache.set(RESERVED_STOCK_KEY, reserved, RESERVED_STOCK_SECONDS)
+    return reserved
+
+def forget_reserved_stock():
+    transaction.on_commit(lambda: cache.delete(RESERVED_STOCK_KEY))
+
+def with_available_stock(products, reserved):
+    # copies, the cached rows are shared between requests
+    return [
+        {**product, 'stock': product['stock'] - reserved.get(product['id'], 0)}
+        for product in products
+    ]
+
+def _single_flight(key, loader):
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _inflight[key] = _Call()
+
+    if not is_leader:
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    try:
+        value = cache.get(key)
+        if value is None:
+            value = loader()
+            cache.set(key, value, CATALOG_CACHE_TIMEOUT)
+        call.value = value
+        return value
+    except Exception as error:
+        call.error = error
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call.event.set()
+
+def get_or_load(key, loader):
+    """
+    Return the cached catalog value for `key`, calling `loader` on a miss.
+    Entries are keyed by the catalog version, so a bump makes every older entry
+    unreachable instead of deleting them one by one. Concurrent misses on the same
+    key in this process wait for a single loader call.
+    """
+    versioned_key = f'product:catalog:{get_catalog_version()}:{key}'
+    value = local_cache.get(versioned_key)
+    if value is not None:
+        return value
+
+    value = cache.get(versioned_key)
+    if value is None:
+        value = _single_flight(versioned_key, loader)
+    local_cache.set(versioned_key, value)
+    return value
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from product.search import rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'rebuild the full-text search index of products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **kwargs):
+        rebuild_search_index(kwargs['database'])
+        print("product search index berhasil dibuat ulang")
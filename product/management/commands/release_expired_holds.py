@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from product.reservations import release_expired
+
+class Command(BaseCommand):
+    help = 'release stock reservations whose hold has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help='keep running, sweeping every INTERVAL seconds')
+
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+        while True:
+            released = release_expired()
+            print(f"{released} reservasi stok dilepas")
+            if not interval:
+                break
+            time.sleep(interval)
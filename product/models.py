@@ -6,8 +6,31 @@ class Product(models.Model):
         permissions = [
             ("buy_product", "Can buy product")
         ]
+        indexes = [
+            models.Index(fields=['product_name', 'id'], name='product_catalog_idx'),
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     product_name = models.CharField(max_length=69)
     price = models.DecimalField(max_digits=12, decimal_places=0, default=0)
     description = models.CharField(max_length=150)
     stock = models.IntegerField()
+    # units held by active reservations, only changed through product.reservations
+    reserved = models.IntegerField(default=0)
+
+    @property
+    def available_stock(self):
+        return self.stock - self.reserved
+
+class StockReservation(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product_reservation'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    cart = models.ForeignKey('cart.Cart', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
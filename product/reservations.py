@@ -0,0 +1,174 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+from .models import Product, StockReservation
+from .cache import bump_catalog_version, forget_reserved_stock
+
+CART_HOLD_TTL = timedelta(minutes=getattr(settings, 'CART_HOLD_MINUTES', 15))
+CHECKOUT_HOLD_TTL = timedelta(minutes=getattr(settings, 'CHECKOUT_HOLD_MINUTES', 30))
+
+# Stock is never checked with a read followed by a write. Holds are counted in
+# Product.reserved with a conditional UPDATE, so two carts racing for the last unit
+# cannot both win, and the available stock of a product is stock - reserved.
+def _reserve(product_id, quantity):
+    return Product.objects.filter(
+        id=product_id, stock__gte=F('reserved') + quantity
+    ).update(reserved=F('reserved') + quantity) == 1
+
+def _unreserve(product_id, quantity):
+    Product.objects.filter(id=product_id).update(reserved=F('reserved') - quantity)
+
+def available_stock(product_id):
+    product = Product.objects.filter(id=product_id).values('stock', 'reserved').first()
+    if product is None:
+        return 0
+    return product['stock'] - product['reserved']
+
+def hold(cart_id, product_id, quantity, ttl=CART_HOLD_TTL):
+    """
+    Make the cart hold exactly `quantity` units of the product until now + ttl.
+    Returns False, leaving the previous hold untouched, when not enough stock is free.
+    """
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        reservation = StockReservation.objects.select_for_update().filter(
+            cart_id=cart_id, product_id=product_id
+        ).first()
+        held = reservation.quantity if reservation else 0
+        # an expired hold is still counted in reserved until the sweeper runs, so it can be reused
+        delta = quantity - held
+
+        if delta > 0 and not _reserve(product_id, delta):
+            return False
+        if delta < 0:
+            _unreserve(product_id, -delta)
+        if delta:
+            forget_reserved_stock()
+
+        if quantity == 0:
+            if reservation:
+                reservation.delete()
+        elif reservation:
+            reservation.quantity = quantity
+            reservation.expires_at = expires_at
+            reservation.save(update_fields=['quantity', 'expires_at'])
+        else:
+            StockReservation.objects.create(
+                cart_id=cart_id, product_id=product_id, quantity=quantity, expires_at=expires_at
+            )
+    return True
+
+def hold_cart(cart_id, lines, ttl=CHECKOUT_HOLD_TTL):
+    """
+    Hold every (product_id, quantity) in `lines` for the cart, all or nothing.
+    Returns the product ids that could not be held.
+    """
+    failed = []
+    with transaction.atomic():
+        for product_id, quantity in lines:
+            if not hold(cart_id, product_id, quantity, ttl):
+                failed.append(product_id)
+        if failed:
+            transaction.set_rollback(True)
+    return failed
+
+def release(cart_id, product_id):
+    hold(cart_id, product_id, 0)
+
+def release_cart(cart_id):
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update().filter(cart_id=cart_id).values_list('id', 'product_id', 'quantity')
+        )
+        if not reservations:
+            return
+        for _, product_id, quantity in reservations:
+            _unreserve(product_id, quantity)
+        StockReservation.objects.filter(id__in=[reservation[0] for reservation in reservations]).delete()
+        forget_reserved_stock()
+
+def release_deleted_cart(sender, instance, **kwargs):
+    # cascade deletes of a cart drop its reservations without giving the units back
+    release_cart(instance.pk)
+
+def release_deleted_line(sender, instance, **kwargs):
+    release(instance.cart_id, instance.product_id)
+
+def _per_product(values):
+    # CASE id WHEN ... THEN n END, lets one UPDATE apply a different amount to every product
+    return Case(
+        *[When(id=product_id, then=Value(amount)) for product_id, amount in values.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+def commit_cart(cart_id, lines):
+    """
+    Turn the cart holds into sold stock with one UPDATE over all lines. Lines whose
+    hold already expired are sold only when enough unreserved stock is left.
+    Returns the product ids that failed, nothing is written in that case.
+    """
+    sold = {}
+    for product_id, quantity in lines:
+        sold[product_id] = sold.get(product_id, 0) + quantity
+    with transaction.atomic():
+        held = dict(
+            StockReservation.objects.select_for_update().filter(cart_id=cart_id).values_list('product_id', 'quantity')
+        )
+        from_hold = {product_id: min(held.get(product_id, 0), quantity) for product_id, quantity in sold.items()}
+        extra = {product_id: quantity - from_hold[product_id] for product_id, quantity in sold.items()}
+
+        if sold:
+            failed = list(
+                Product.objects.filter(id__in=sold.keys(), stock__lt=F('reserved') + _per_product(extra))
+                .values_list('id', flat=True)
+            )
+            if not failed:
+                updated = Product.objects.filter(
+                    id__in=sold.keys(), stock__gte=F('reserved') + _per_product(extra)
+                ).update(
+                    stock=F('stock') - _per_product(sold),
+                    reserved=F('reserved') - _per_product(from_hold),
+                )
+                if updated != len(sold):
+                    failed = [product_id for product_id in sold if product_id not in held] or list(sold)
+            if failed:
+                transaction.set_rollback(True)
+                return failed
+
+        # holds left over (product removed from the cart after the hold) are released
+        leftover = {
+            product_id: quantity - from_hold.get(product_id, 0)
+            for product_id, quantity in held.items()
+            if quantity > from_hold.get(product_id, 0)
+        }
+        if leftover:
+            Product.objects.filter(id__in=leftover.keys()).update(reserved=F('reserved') - _per_product(leftover))
+        StockReservation.objects.filter(cart_id=cart_id).delete()
+        # sold stock is a real product write, the holds only change the overlay
+        bump_catalog_version()
+        forget_reserved_stock()
+    return []
+
+def release_expired(now=None):
+    """
+    Release every expired hold with one aggregate query and one UPDATE over the
+    affected products. Returns the number of holds released.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = StockReservation.objects.select_for_update().filter(expires_at__lte=now)
+        ids = list(expired.values_list('id', flat=True))
+        if not ids:
+            return 0
+        totals = list(
+            StockReservation.objects.filter(id__in=ids)
+            .values('product_id').annotate(total=Sum('quantity'))
+        )
+        totals = {row['product_id']: row['total'] for row in totals}
+        Product.objects.filter(id__in=totals.keys()).update(reserved=F('reserved') - _per_product(totals))
+        StockReservation.objects.filter(id__in=ids).delete()
+        forget_reserved_stock()
+    return len(ids)
@@ -0,0 +1,112 @@
+import re
+from django.db import connections, DEFAULT_DB_ALIAS
+from .models import Product
+
+SEARCH_TABLE = 'product_search'
+SEARCH_FIELDS = ('id', 'product_name', 'stock', 'reserved', 'price', 'description')
+
+# External-content FTS5 index over product_product, keyed by the base table rowid.
+# The triggers keep it in sync with every write, ORM or raw SQL, so the admin
+# create/update/delete views need no extra code.
+SEARCH_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        product_name, description,
+        content='product_product', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product_product BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, product_name, description)
+        VALUES (new.rowid, new.product_name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product_product BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, product_name, description)
+        VALUES ('delete', old.rowid, old.product_name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name, description ON product_product BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, product_name, description)
+        VALUES ('delete', old.rowid, old.product_name, old.description);
+        INSERT INTO {SEARCH_TABLE}(rowid, product_name, description)
+        VALUES (new.rowid, new.product_name, new.description);
+    END
+    """,
+]
+
+def is_supported(connection):
+    return connection.vendor == 'sqlite'
+
+def ensure_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=%s", [SEARCH_TABLE]
+        )
+        exists = cursor.fetchone() is not None
+        for statement in SEARCH_SCHEMA:
+            cursor.execute(statement)
+        if not exists:
+            # index rows that were already in product_product
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    # rowids of product_product can change after VACUUM, rebuild afterwards
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    ensure_search_index(using)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+def build_match_query(query):
+    # quote every term so user input can never be read as FTS5 syntax,
+    # the trailing * makes each term a prefix match
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_products(query, limit=20, using=DEFAULT_DB_ALIAS):
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    connection = connections[using]
+    if not is_supported(connection):
+        products = Product.objects.filter(product_name__icontains=query) | Product.objects.filter(description__icontains=query)
+        results = list(products.values(*SEARCH_FIELDS).order_by('product_name', 'id')[:limit])
+        for product in results:
+            product['stock'] -= product.pop('reserved')
+        return results
+
+    columns = ', '.join(f'p.{field}' for field in SEARCH_FIELDS)
+    with connection.cursor() as cursor:
+        # product_name hits weigh more than description hits
+        cursor.execute(
+            f"""
+            SELECT {columns}
+            FROM {SEARCH_TABLE} s
+            JOIN product_product p ON p.rowid = s.rowid
+            WHERE {SEARCH_TABLE} MATCH %s
+            ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0)
+            LIMIT %s
+            """,
+            [match, limit],
+        )
+        rows = cursor.fetchall()
+
+    id_field = Product._meta.get_field('id')
+    results = []
+    for row in rows:
+        product = dict(zip(SEARCH_FIELDS, row))
+        product['id'] = id_field.to_python(product['id'])
+        # available stock, the same number the catalog shows
+        product['stock'] -= product.pop('reserved')
+        results.append(product)
+    return results
@@ -1,3 +1,197 @@
-from django.test import TestCase
+import json
+from unittest.mock import patch
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from main.models import Customer
+from cart.models import Cart
+from .models import Product, StockReservation
+from . import reservations
+from .cache import LRUCache, local_cache, get_catalog_version
+from core.pagination import encode_cursor
 
-# Create your tests here.
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create_user(username='customer', password='password123')
+        for i in range(5):
+            Product.objects.create(product_name=f'product{i}', stock=10, price=1000, description='')
+        # same name as an existing product, the id breaks the tie
+        Product.objects.create(product_name='product2', stock=10, price=1000, description='')
+
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_catalog_pages_cover_every_product_once(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(reverse('product:catalog'), params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['products']), 2)
+            seen.extend(product['id'] for product in data['products'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = Product.objects.order_by('product_name', 'id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(product_id) for product_id in expected])
+
+    def test_catalog_shows_stock_that_is_not_held(self):
+        product = Product.objects.get(product_name='product0')
+        cart = Cart.objects.create(customer=Customer.objects.create(user=self.user))
+        self.client.get(reverse('product:catalog'))
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.hold(cart.id, product.id, 4)
+        # holds keep the cached catalog, only the stock overlay is reloaded
+        self.assertEqual(get_catalog_version(), version)
+        products = {row['id']: row for row in self.client.get(reverse('product:catalog')).json()['products']}
+        self.assertEqual(products[str(product.id)]['stock'], 6)
+
+    def test_catalog_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('product:catalog'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_catalog_cursor_is_validated_before_the_cache(self):
+        response = self.client.get(reverse('product:catalog'), {'cursor': encode_cursor(['product1', 'not-a-uuid'])})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(any(':page:' in key for key in local_cache._data))
+
+        product = Product.objects.get(product_name='product0')
+        # the hex and the hyphenated spelling of the id share one cache entry
+        self.client.get(reverse('product:catalog'), {'cursor': encode_cursor(['product0', product.id.hex])})
+        self.client.get(reverse('product:catalog'), {'cursor': encode_cursor(['product0', str(product.id)])})
+        self.assertEqual(len([key for key in local_cache._data if ':page:' in key]), 1)
+
+    def test_local_cache_entries_expire(self):
+        lru = LRUCache(2, timeout=0)
+        lru.set('page', 1)
+        self.assertIsNone(lru.get('page'))
+
+    def test_catalog_is_cached_until_a_product_changes(self):
+        self.client.get(reverse('product:all_product'))
+        # only the session and user lookups, no product query
+        with self.assertNumQueries(2):
+            self.client.get(reverse('product:all_product'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(product_name='product9', stock=1, price=1000, description='')
+        response = self.client.get(reverse('product:all_product'))
+        self.assertEqual(len(response.json()['products']), 7)
+
+    def test_catalog_conditional_get(self):
+        response = self.client.get(reverse('product:catalog'))
+        etag = response['ETag']
+
+        response = self.client.get(reverse('product:catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(product_name='product0').first().delete()
+        response = self.client.get(reverse('product:catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_requires_login(self):
+        response = Client().get(reverse('product:catalog'))
+        self.assertEqual(response.status_code, 302)
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='customer', password='password123')
+        self.rice = Product.objects.create(product_name='Beras Premium', stock=10, price=1000, description='rice from cianjur')
+        self.soap = Product.objects.create(product_name='Sabun Mandi', stock=10, price=1000, description='premium soap')
+
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        response = self.client.get(reverse('product:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()['products']]
+
+    def test_search_matches_prefix_and_ranks_name_first(self):
+        self.assertEqual(self.search('prem'), [str(self.rice.id), str(self.soap.id)])
+
+    def test_search_index_follows_update_and_delete(self):
+        self.rice.product_name = 'Gula Pasir'
+        self.rice.save()
+        self.assertEqual(self.search('beras'), [])
+        self.assertEqual(self.search('gula'), [str(self.rice.id)])
+
+        self.soap.delete()
+        self.assertEqual(self.search('sabun'), [])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search('"beras* (premium'), [str(self.rice.id)])
+
+class ExportTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            Product.objects.create(product_name=f'product{i}', stock=10, price=1000, description='')
+
+    @patch('product.views.EXPORT_CHUNK_SIZE', 2)
+    def test_export_streams_json_array(self):
+        response = Client().get(reverse('product:get_product'))
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['products']), 3)
+        self.assertEqual(sorted(product['product_name'] for product in data['products']), ['product0', 'product1', 'product2'])
+
+    def test_export_streams_ndjson(self):
+        response = Client().get(reverse('product:get_product'), {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        names = sorted(json.loads(line)['product_name'] for line in lines)
+        self.assertEqual(names, ['product0', 'product1', 'product2'])
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_name='rice', stock=5, price=1000, description='')
+        self.carts = []
+        for i in range(2):
+            user = User.objects.create_user(username=f'customer{i}', password='password123')
+            self.carts.append(Cart.objects.create(customer=Customer.objects.create(user=user)))
+
+    def test_hold_never_oversells(self):
+        first, second = self.carts
+        self.assertTrue(reservations.hold(first.id, self.product.id, 3))
+        self.assertFalse(reservations.hold(second.id, self.product.id, 3))
+        self.assertTrue(reservations.hold(second.id, self.product.id, 2))
+        self.assertEqual(reservations.available_stock(self.product.id), 0)
+
+        # shrinking a hold gives the units back
+        self.assertTrue(reservations.hold(first.id, self.product.id, 1))
+        self.assertEqual(reservations.available_stock(self.product.id), 2)
+
+    def test_release_expired_frees_stock(self):
+        first, second = self.carts
+        reservations.hold(first.id, self.product.id, 2)
+        reservations.hold(second.id, self.product.id, 2, ttl=timedelta(minutes=60))
+
+        released = reservations.release_expired(timezone.now() + timedelta(minutes=30))
+        self.assertEqual(released, 1)
+        self.assertEqual(reservations.available_stock(self.product.id), 3)
+        self.assertFalse(StockReservation.objects.filter(cart=first).exists())
+
+    def test_commit_cart_sells_held_stock(self):
+        first, second = self.carts
+        reservations.hold(first.id, self.product.id, 2)
+        reservations.hold(second.id, self.product.id, 3)
+
+        self.assertEqual(reservations.commit_cart(first.id, [(self.product.id, 2)]), [])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (3, 3))
+
+        # nothing left for a cart whose hold is gone
+        StockReservation.objects.filter(cart=second).delete()
+        self.assertEqual(reservations.commit_cart(second.id, [(self.product.id, 1)]), [self.product.id])
@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import all_product, get_product
+from .views import all_product, get_product, catalog, search
 
 app_name = 'product'
 
 urlpatterns = [
     path('all_product', all_product, name='all_product'),
-    path('get_product', get_product, name='get_product')
+    path('get_product', get_product, name='get_product'),
+    path('catalog', catalog, name='catalog'),
+    path('search', search, name='search'),
 ]
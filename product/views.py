@@ -1,13 +1,28 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .models import Product
 from django.db import connection
+from django.conf import settings
+from core.pagination import decode_cursor, encode_cursor, keyset_page, parse_page_size
+from .search import search_products
+from .cache import get_or_load, get_catalog_version, get_reserved_stock, with_available_stock
+import uuid
 
-@login_required
-def all_product(request):
+CATALOG_FIELDS = ('id', 'product_name', 'stock', 'price', 'description')
+
+def catalog_etag(request, *args, **kwargs):
+    # the catalog version changes on every product write and the held units are
+    # tagged separately, no rows are read while both are cached
+    reserved = get_reserved_stock()
+    return f'catalog-{get_catalog_version()}-{hash(frozenset(reserved.items())) & 0xffffffff:x}'
+
+def load_all_products():
     products = Product.objects.all() 
-    product_json = [
+    return [
         {
             'id' : product.id,
             'product_name': product.product_name,
@@ -16,11 +31,90 @@ def all_product(request):
             'description': product.description,
         } for product in products
     ]
-     
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
+def all_product(request):
+    product_json = with_available_stock(get_or_load('all', load_all_products), get_reserved_stock())
     return JsonResponse(data={'products' : product_json})
 
-def get_product(request):
+def catalog_cursor(cursor):
+    # the cache key is built from the decoded (product_name, id) pair, so only
+    # well-formed cursors reach the cache and every spelling of one maps to one key
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not isinstance(values[0], str):
+        raise ValueError('invalid cursor')
+    try:
+        values[1] = str(uuid.UUID(str(values[1])))
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor')
+    return encode_cursor(values)
+
+def load_catalog_page(cursor, page_size):
+    products = Product.objects.values(*CATALOG_FIELDS)
+    rows, next_cursor = keyset_page(products, ('product_name', 'id'), cursor, page_size)
+    for row in rows:
+        row['price'] = float(row['price'])
+    return {'products': rows, 'next_cursor': next_cursor}
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
+def catalog(request):
+    page_size = parse_page_size(
+        request.GET.get('page_size'),
+        default=getattr(settings, 'PRODUCT_CATALOG_PAGE_SIZE', 24),
+    )
+    cursor = request.GET.get('cursor') or None
+    try:
+        if cursor:
+            cursor = catalog_cursor(cursor)
+        page = get_or_load(f'page:{cursor}:{page_size}', lambda: load_catalog_page(cursor, page_size))
+    except ValueError:
+        return JsonResponse({'message': 'invalid cursor'}, status=400)
+    # held units cannot be added to another cart
+    page = {**page, 'products': with_available_stock(page['products'], get_reserved_stock())}
+    return JsonResponse(data=page)
+
+@login_required
+def search(request):
+    query = request.GET.get('q', '').strip()
+    limit = parse_page_size(request.GET.get('limit'), default=20, maximum=50)
+    products = search_products(query, limit)
+    for product in products:
+        product['price'] = float(product['price'])
+    return JsonResponse(data={'products': products})
+
+EXPORT_CHUNK_SIZE = 500
+
+def stream_products(as_ndjson=False):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
     with connection.cursor() as cursor:
         cursor.execute("select * from product_product")
-        products = cursor.fetchall()
-    return JsonResponse({'products': products})
\ No newline at end of file
+        columns = [column[0] for column in cursor.description]
+        if not as_ndjson:
+            yield '{"products":['
+        first = True
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            # both formats carry the same records, keyed by column name
+            records = [encoder.encode(dict(zip(columns, row))) for row in rows]
+            if as_ndjson:
+                yield ''.join(record + '\n' for record in records)
+            else:
+                chunk = ','.join(records)
+                yield chunk if first else ',' + chunk
+                first = False
+        if not as_ndjson:
+            yield ']}'
+
+def get_product(request):
+    as_ndjson = (
+        request.GET.get('format') == 'ndjson'
+        or 'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+    content_type = 'application/x-ndjson' if as_ndjson else 'application/json'
+    return StreamingHttpResponse(stream_products(as_ndjson), content_type=content_type)
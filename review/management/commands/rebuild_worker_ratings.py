@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from review.ratings import rebuild_worker_ratings
+
+class Command(BaseCommand):
+    help = 'recompute the rating aggregates of every worker from the reviews'
+
+    def handle(self, *args, **kwargs):
+        rated = rebuild_worker_ratings()
+        print(f"rating {rated} worker berhasil dihitung ulang")
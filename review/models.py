@@ -1,7 +1,7 @@
 from django.db import models
 import uuid
 from order.models import Order
-from main.models import Customer
+from main.models import Customer, Worker
 
 class FraudReport(models.Model):
     report_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -15,3 +15,22 @@ class Review(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     description = models.TextField()
     rating = models.IntegerField()
+
+class WorkerRating(models.Model):
+    # running totals of the reviews on orders a worker delivered, kept by review.ratings
+    worker = models.OneToOneField(Worker, on_delete=models.CASCADE, primary_key=True)
+    count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
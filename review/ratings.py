@@ -0,0 +1,80 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from wallet.models import OrderPayment
+from .models import Review, WorkerRating
+
+STARS = range(1, 6)
+
+
+def _worker_id(order_id):
+    return OrderPayment.objects.filter(order_id=order_id).values_list('worker_id', flat=True).first()
+
+def _apply(worker_id, changes):
+    """
+    Add `changes` ({rating: +1 or -1}) to the worker's aggregates with one UPDATE,
+    creating the row the first time the worker is rated.
+    """
+    updates = {}
+    count = total = 0
+    for rating, sign in changes.items():
+        if sign == 0:
+            continue
+        count += sign
+        total += sign * rating
+        if rating in STARS:
+            updates[f'stars_{rating}'] = F(f'stars_{rating}') + sign
+    if not updates and not count and not total:
+        return
+    updates.update(count=F('count') + count, total=F('total') + total)
+
+    with transaction.atomic():
+        if not WorkerRating.objects.filter(worker_id=worker_id).update(**updates):
+            try:
+                with transaction.atomic():
+                    WorkerRating.objects.create(worker_id=worker_id)
+            except IntegrityError:
+                # created by a concurrent review
+                pass
+            WorkerRating.objects.filter(worker_id=worker_id).update(**updates)
+
+def record_review(review):
+    worker_id = _worker_id(review.order_id)
+    if worker_id:
+        _apply(worker_id, {review.rating: 1})
+
+def change_review(review, old_rating):
+    if old_rating == review.rating:
+        return
+    worker_id = _worker_id(review.order_id)
+    if worker_id:
+        _apply(worker_id, {old_rating: -1, review.rating: 1})
+
+def forget_review(review):
+    worker_id = _worker_id(review.order_id)
+    if worker_id:
+        _apply(worker_id, {review.rating: -1})
+
+def rebuild_worker_ratings():
+    """
+    Recompute every worker's aggregates from the reviews in one GROUP BY pass.
+    Returns the number of workers with ratings.
+    """
+    histogram = {f'stars_{stars}': Count('review_id', filter=Q(rating=stars)) for stars in STARS}
+    rows = list(
+        Review.objects.filter(order__orderpayment__worker__isnull=False)
+        .values('order__orderpayment__worker_id')
+        .annotate(count=Count('review_id'), total=Sum('rating'), **histogram)
+        .order_by()
+    )
+    with transaction.atomic():
+        WorkerRating.objects.all().delete()
+        WorkerRating.objects.bulk_create(
+            WorkerRating(
+                worker_id=row['order__orderpayment__worker_id'],
+                count=row['count'],
+                total=row['total'],
+                **{name: row[name] for name in histogram},
+            )
+            for row in rows
+        )
+    return len(rows)
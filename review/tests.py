@@ -1,3 +1,101 @@
 from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from main.models import Customer, Worker
+from cart.models import Cart
+from order.models import Order, OrderStatus
+from wallet.models import WalletAccount, OrderPayment
+from .models import Review, WorkerRating
+from . import ratings
+import uuid
 
-# Create your tests here.
+
+class WorkerRatingTests(TestCase):
+
+    def setUp(self):
+        status = OrderStatus.objects.create(id=uuid.uuid4(), status='reviewed')
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='buyer', password='password123'))
+        wallet_account = WalletAccount.objects.create(user=self.customer.user, pin='')
+        self.worker = Worker.objects.create(user=User.objects.create_user(username='courier', password='password123'))
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(cart=Cart.objects.create(customer=self.customer, is_checked_out=True), status=status, total=100)
+            OrderPayment.objects.create(order=order, walletAccount=wallet_account, worker=self.worker)
+            self.orders.append(order)
+
+    def review(self, order, rating):
+        review = Review.objects.create(customer=self.customer, order=order, description='pengiriman cepat', rating=rating)
+        ratings.record_review(review)
+        return review
+
+    def test_aggregates_follow_review_writes(self):
+        first = self.review(self.orders[0], 5)
+        self.review(self.orders[1], 3)
+
+        first.rating = 4
+        first.save()
+        ratings.change_review(first, 5)
+
+        aggregate = WorkerRating.objects.get(worker=self.worker)
+        self.assertEqual((aggregate.count, aggregate.total), (2, 7))
+        self.assertEqual(aggregate.histogram, {1: 0, 2: 0, 3: 1, 4: 1, 5: 0})
+
+        ratings.forget_review(first)
+        first.delete()
+        aggregate.refresh_from_db()
+        self.assertEqual(aggregate.average, 3)
+
+    def test_rebuild_matches_incremental_aggregates(self):
+        self.review(self.orders[0], 5)
+        self.review(self.orders[1], 2)
+        self.review(self.orders[2], 2)
+        incremental = WorkerRating.objects.get(worker=self.worker)
+
+        WorkerRating.objects.all().delete()
+        self.assertEqual(ratings.rebuild_worker_ratings(), 1)
+        rebuilt = WorkerRating.objects.get(worker=self.worker)
+        self.assertEqual((rebuilt.count, rebuilt.total), (incremental.count, incremental.total))
+        self.assertEqual(rebuilt.histogram, incremental.histogram)
+
+
+class ReviewViewRatingTests(TestCase):
+
+    def setUp(self):
+        OrderStatus.objects.create(id=uuid.uuid4(), status='completed')
+        OrderStatus.objects.create(id=uuid.uuid4(), status='reviewed')
+        customer = Customer.objects.create(user=User.objects.create_user(username='buyer', password='password123'))
+        self.worker = Worker.objects.create(user=User.objects.create_user(username='courier', password='password123'))
+        self.order = Order.objects.create(
+            cart=Cart.objects.create(customer=customer, is_checked_out=True),
+            status=OrderStatus.objects.get(status='completed'), total=100,
+        )
+        OrderPayment.objects.create(
+            order=self.order, walletAccount=WalletAccount.objects.create(user=customer.user, pin=''), worker=self.worker,
+        )
+        self.client.login(username='buyer', password='password123')
+
+    def rating(self):
+        aggregate = WorkerRating.objects.get(worker=self.worker)
+        return aggregate.count, aggregate.total
+
+    def test_review_views_keep_the_worker_rating(self):
+        response = self.client.post(
+            reverse('review:create_review', args=[self.order.id]), {'description': 'pengiriman cepat', 'rating': 4},
+        )
+        self.assertRedirects(response, reverse('main:home'), fetch_redirect_response=False)
+        self.assertEqual(self.rating(), (1, 4))
+
+        review = Review.objects.get(order=self.order)
+        self.client.post(reverse('review:update_review', args=[review.review_id]), {'description': 'pengiriman lambat', 'rating': 2})
+        self.assertEqual(self.rating(), (1, 2))
+        self.assertEqual(WorkerRating.objects.get(worker=self.worker).histogram[2], 1)
+
+        self.client.post(reverse('review:delete_review', args=[review.review_id]))
+        self.assertEqual(self.rating(), (0, 0))
+
+    def test_second_review_of_an_order_is_not_counted(self):
+        data = {'description': 'pengiriman cepat', 'rating': 5}
+        self.client.post(reverse('review:create_review', args=[self.order.id]), data)
+        response = self.client.post(reverse('review:create_review', args=[self.order.id]), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.rating(), (1, 5))
@@ -1,12 +1,15 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from order.models import Order, OrderStatus
+from order.models import Order
+from order import statuses
+from order.transitions import transition
+from django.db import transaction
 import uuid
 from .forms import FraudReportForm, ReviewForm
 from .models import FraudReport, Review
+from . import ratings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
-from core.views import get_user_role
 from django.http import JsonResponse
 
 @login_required
@@ -18,7 +21,7 @@ def create_fraud_report(request, order_id):
         if form.is_valid():
             fraud_report = form.save(commit=False)
             fraud_report.report_id = uuid.uuid4()
-            fraud_report.customer = request.user.customer
+            fraud_report.customer = request.profile
             fraud_report.order = order
             fraud_report.save()
 
@@ -57,13 +60,15 @@ def create_review(request, order_id):
     if request.method == "POST":
         form = ReviewForm(request.POST)
         if form.is_valid():
-            review = form.save(commit=False)
-            review.review_id = uuid.uuid4()
-            review.customer = request.user.customer
-            review.order = order
-            review.save()
-            order.status = OrderStatus.objects.filter(status='reviewed').first()
-            order.save()
+            with transaction.atomic():
+                if not transition(order, statuses.REVIEWED):
+                    return JsonResponse({'message': 'only completed orders can be reviewed'}, status=400)
+                review = form.save(commit=False)
+                review.review_id = uuid.uuid4()
+                review.customer = request.profile
+                review.order = order
+                review.save()
+                ratings.record_review(review)
             return redirect("main:home")
     else:
         form = ReviewForm()
@@ -73,24 +78,24 @@ def create_review(request, order_id):
 @login_required
 def get_report(request):
     context = {'user': request.user}
-    if get_user_role(request.user) == 'Customer':
+    if request.role == 'Customer':
         context['is_customer'] = True
     else:
         return JsonResponse({'message': 'hmm you cannot see this, your not customer'})
 
-    reports = FraudReport.objects.filter(customer=request.user.customer)
+    reports = FraudReport.objects.filter(customer=request.profile)
     context['reports'] = reports
     return render(request, 'user_report.html', context)
 
 @login_required
 def get_review(request):
     context = {'user': request.user}
-    if get_user_role(request.user) == 'Customer':
+    if request.role == 'Customer':
         context['is_customer'] = True
     else:
         return JsonResponse({'message': 'hmm you cannot see this, your not customer'})
 
-    reviews = Review.objects.filter(customer=request.user.customer)
+    reviews = Review.objects.filter(customer=request.profile)
     context['reviews'] = reviews
     return render(request, 'user_review.html', context)
 
@@ -98,9 +103,13 @@ def get_review(request):
 def update_review(request, review_id):
     review = get_object_or_404(Review, pk=review_id)
     if request.method == "POST":
+        # the form writes the new rating onto the instance while validating
+        old_rating = review.rating
         form = ReviewForm(request.POST, instance=review)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                ratings.change_review(review, old_rating)
             redirect("main:home")
         else:
             messages.error(request, "Terjadi kesalahan dalam pengisian formulir.")
@@ -111,6 +120,8 @@ def update_review(request, review_id):
 @login_required
 def delete_review(request, review_id):
     review = get_object_or_404(Review, pk=review_id)
-    review.delete()
+    with transaction.atomic():
+        ratings.forget_review(review)
+        review.delete()
     messages.success(request, "Review berhasil dihapus.")
     return redirect("main:home")
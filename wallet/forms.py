@@ -61,9 +61,12 @@ class TopUpForm(forms.Form):
         label='Top-up Amount'
     )
 class PaymentForm(forms.Form):
+    # not needed while the wallet session carries a payment token
     pin = forms.CharField(
         max_length=6,
+        required=False,
         widget=forms.PasswordInput(attrs={'class': 'w-full px-4 py-3 rounded-lg border border-taupe bg-gray focus:outline-none focus:ring-2 focus:ring-slate focus:border-transparent transition duration-200'}),
         label='Wallet PIN'
     )
 
+    idempotency_key = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput)
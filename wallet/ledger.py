@@ -0,0 +1,77 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from .models import Wallet, WalletEntry, WalletCheckpoint
+
+# entries younger than this are left out of a checkpoint, an insert that got its id
+# earlier may still be uncommitted and would otherwise be skipped for good
+CHECKPOINT_DELAY = timedelta(minutes=1)
+
+
+def _lock(wallet):
+    # serializes debits and checkpoints of one wallet
+    Wallet.objects.select_for_update().values_list('id', flat=True).get(id=wallet.id)
+
+def _base(wallet_id):
+    # (balance, entry id) of the latest checkpoint, wallets without one start from Wallet.saldo
+    checkpoint = WalletCheckpoint.objects.filter(wallet_id=wallet_id).order_by('-entry_id').values('entry_id', 'balance').first()
+    if checkpoint:
+        return checkpoint['balance'], checkpoint['entry_id']
+    return Wallet.objects.values_list('saldo', flat=True).get(id=wallet_id), 0
+
+def _position(wallet_id):
+    # (balance, entries since the checkpoint) from the latest checkpoint plus what was appended after it
+    balance, after = _base(wallet_id)
+    totals = WalletEntry.objects.filter(wallet_id=wallet_id, id__gt=after).aggregate(total=Sum('amount'), count=Count('id'))
+    return balance + (totals['total'] or 0), totals['count']
+
+def get_balance(wallet):
+    return _position(wallet.id)[0]
+
+def credit(wallet, amount, kind, order=None):
+    # credits only append, the wallet row is not touched
+    return WalletEntry.objects.create(wallet_id=wallet.id, kind=kind, amount=amount, order=order)
+
+def debit(wallet, amount, kind=WalletEntry.PAYMENT, order=None):
+    """
+    Append a debit when the balance covers it. Debits on one wallet are serialized
+    by locking its row, credits never wait for that lock. Returns False when the
+    balance is too low.
+    """
+    with transaction.atomic():
+        _lock(wallet)
+        balance, since = _position(wallet.id)
+        if balance < amount:
+            return False
+        WalletEntry.objects.create(wallet_id=wallet.id, kind=kind, amount=-amount, order=order)
+        if since + 1 >= settings.WALLET_CHECKPOINT_EVERY:
+            checkpoint(wallet)
+    return True
+
+def checkpoint(wallet, now=None):
+    """
+    Write the balance up to the newest settled entry as a checkpoint and mirror it to
+    Wallet.saldo. Returns the checkpoint, or None when nothing settled since the last one.
+    """
+    cutoff = (now or timezone.now()) - CHECKPOINT_DELAY
+    with transaction.atomic():
+        _lock(wallet)
+        balance, after = _base(wallet.id)
+        entries = WalletEntry.objects.filter(wallet_id=wallet.id, id__gt=after)
+        settled = entries.filter(created_at__lt=cutoff).aggregate(last=Max('id'))['last']
+        if settled is None:
+            return None
+        balance += entries.filter(id__lte=settled).aggregate(total=Sum('amount'))['total'] or 0
+        created = WalletCheckpoint.objects.create(wallet_id=wallet.id, entry_id=settled, balance=balance)
+        Wallet.objects.filter(id=wallet.id).update(saldo=balance)
+    return created
+
+def checkpoint_all(now=None):
+    # wallets with entries past their latest checkpoint
+    created = 0
+    for wallet in Wallet.objects.filter(walletentry__isnull=False).distinct().only('id'):
+        if checkpoint(wallet, now):
+            created += 1
+    return created
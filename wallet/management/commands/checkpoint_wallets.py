@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from wallet.ledger import checkpoint_all
+
+class Command(BaseCommand):
+    help = 'write balance checkpoints for wallets with new ledger entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help='keep running, checkpointing every INTERVAL seconds')
+
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+        while True:
+            created = checkpoint_all()
+            print(f"{created} checkpoint saldo dibuat")
+            if not interval:
+                break
+            time.sleep(interval)
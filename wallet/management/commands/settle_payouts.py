@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from wallet.payouts import settle_payouts
+
+class Command(BaseCommand):
+    help = 'credit pending delivery fee payouts to worker wallets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help='keep running, settling every INTERVAL seconds')
+
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+        while True:
+            settled = settle_payouts()
+            print(f"payout {settled} wallet diselesaikan")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 from datetime import timedelta
@@ -27,7 +28,11 @@ def validate_uuid(value):
 class WalletAccount(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    pin = models.CharField(max_length=6, validators=[pin_validator])
+    # stores the hash, the 6 digit rule is checked on the raw PIN in set_pin
+    pin = models.CharField(max_length=128)
+    # hasher algorithm for this wallet, empty means settings.WALLET_PIN_HASHER
+    pin_hasher = models.CharField(max_length=32, blank=True, default='')
+    # only written when a lockout is triggered, failed attempts are counted in wallet.throttle
     login_attempts = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     last_attempt = models.DateTimeField(auto_now=True)
     
@@ -40,18 +45,24 @@ class WalletAccount(models.Model):
         # Validate PIN before hashing
         if not re.match(r'^\d{6}$', raw_pin):
             raise ValidationError('PIN must be exactly 6 digits')
-        self.pin = make_password(raw_pin)
+        self.pin = make_password(raw_pin, hasher=self.get_pin_hasher())
+
+    def get_pin_hasher(self):
+        return self.pin_hasher or settings.WALLET_PIN_HASHER
     
     def check_pin(self, raw_pin):
         # Validate PIN format before checking
-        if not re.match(r'^\d{6}$', raw_pin):
+        if not raw_pin or not re.match(r'^\d{6}$', raw_pin):
             return False
-        return check_password(raw_pin, self.pin)
-    
-    def reset_attempts_if_needed(self):
-        if timezone.now() - self.last_attempt > timedelta(minutes=10):
-            self.login_attempts = 0
-            self.save()
+
+        def rehash(raw_pin):
+            # called when the stored hash uses another hasher or older parameters
+            self.set_pin(raw_pin)
+            if self.pk:
+                WalletAccount.objects.filter(pk=self.pk).update(pin=self.pin)
+
+        return check_password(raw_pin, self.pin, setter=rehash, preferred=self.get_pin_hasher())
+
 
 class Wallet(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
@@ -92,11 +103,16 @@ class WalletSession(models.Model):
         return False
 
 class OrderPayment(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_payment_created_idx'),
+        ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
     walletAccount = models.ForeignKey(WalletAccount, on_delete=models.CASCADE)
     worker = models.ForeignKey(Worker, on_delete=models.CASCADE, null=True)
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now=True)
+    # set once, the dashboard pages payments on it
+    created_at = models.DateTimeField(auto_now_add=True)
     delivery_fee = models.DecimalField(
         max_digits=12, 
         decimal_places=0, 
@@ -115,3 +131,75 @@ class OrderPayment(models.Model):
             raise ValidationError('Invalid worker instance')
         self.worker = worker
         self.save()
+
+class PaymentRequest(models.Model):
+    # one row per idempotency key, a retried submit finds it and gets the original result
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
+    walletAccount = models.ForeignKey(WalletAccount, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['walletAccount', 'key'], name='payment_request_key_unique'),
+        ]
+
+class RevokedWalletSession(models.Model):
+    # wallet session tokens are verified without the database, revoked ones are listed
+    # here until they would have expired anyway
+    session_id = models.UUIDField(primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+class WalletEntry(models.Model):
+    TOPUP = 'topup'
+    PAYMENT = 'payment'
+    REFUND = 'refund'
+    PAYOUT = 'payout'
+    KIND_CHOICES = [
+        (TOPUP, 'Top-up'),
+        (PAYMENT, 'Payment'),
+        (REFUND, 'Refund'),
+        (PAYOUT, 'Delivery fee payout'),
+    ]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='wallet_entry_wallet_idx'),
+        ]
+    # append-only, the auto increment id is the order entries were written in and
+    # checkpoints refer to it
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # signed, debits are negative
+    amount = models.DecimalField(max_digits=12, decimal_places=0)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class WalletCheckpoint(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'entry_id'], name='wallet_checkpoint_idx'),
+        ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
+    # balance after every entry of the wallet up to and including entry_id
+    entry_id = models.BigIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class PendingPayout(models.Model):
+    # delivery fee owed to a worker, credited to the wallet by the next settlement
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet'], condition=models.Q(entry__isnull=True), name='pending_payout_open_idx'),
+        ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, validators=[validate_uuid])
+    # one payout per paid order, completing twice cannot pay twice
+    order_payment = models.OneToOneField(OrderPayment, on_delete=models.CASCADE)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # the ledger entry that settled it, empty while pending
+    entry = models.ForeignKey(WalletEntry, on_delete=models.SET_NULL, null=True, blank=True)
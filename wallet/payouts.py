@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import PendingPayout, WalletEntry
+
+
+def queue_payout(order_payment, wallet):
+    return PendingPayout.objects.create(order_payment=order_payment, wallet=wallet, amount=order_payment.delivery_fee)
+
+def pending_total(wallet):
+    return PendingPayout.objects.filter(wallet=wallet, entry__isnull=True).aggregate(total=Sum('amount'))['total'] or 0
+
+def settle_payouts(now=None):
+    """
+    Credit every pending payout created up to `now`: one GROUP BY over the pending
+    rows, then one ledger entry per wallet, each written together with marking its
+    payouts settled. Returns the number of wallets credited.
+    """
+    now = now or timezone.now()
+    pending = PendingPayout.objects.filter(entry__isnull=True, created_at__lte=now)
+    totals = pending.values('wallet_id').annotate(total=Sum('amount'), count=Count('id')).order_by()
+
+    settled = 0
+    for row in totals:
+        with transaction.atomic():
+            entry = WalletEntry.objects.create(wallet_id=row['wallet_id'], kind=WalletEntry.PAYOUT, amount=row['total'])
+            claimed = pending.filter(wallet_id=row['wallet_id']).update(entry=entry)
+            if claimed != row['count']:
+                # another settlement got some of these first, the next run picks up the rest
+                transaction.set_rollback(True)
+                continue
+        settled += 1
+    return settled
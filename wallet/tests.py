@@ -1,10 +1,17 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory
 from django.urls import reverse
 from django.contrib.auth.models import User, Group
-from .models import WalletAccount, Wallet, WalletSession
+from .models import WalletAccount, Wallet, WalletSession, PaymentRequest, WalletEntry, OrderPayment
+from .tokens import mint_payment_token, check_payment_token, mint_session_token, revoke_session, revoke_session_token
+from .views import check_wallet_session, page_link
+from . import ledger, payouts, throttle
+from django.conf import settings
+import time
+from django.core.cache import cache
 from main.models import Admin, Customer, Worker
 from order.models import Order, OrderStatus
-from cart.models import Cart
+from cart.models import Cart, ProductCart
+from product.models import Product
 import uuid
 from django.utils import timezone
 from datetime import timedelta
@@ -64,7 +71,7 @@ class WalletTests(TestCase):
         wallet_session = WalletSession.objects.create(walletAccount=self.wallet_account)
 
         session = self.client.session
-        session['walletSession'] = str(wallet_session.id)
+        session['walletSession'] = mint_session_token(wallet_session)
         session.save()
 
         # 1. Dapatkan halaman yang mengandung csrf_token
@@ -86,7 +93,7 @@ class WalletTests(TestCase):
 
         # Simpan walletSession di session
         session = self.client.session
-        session['walletSession'] = str(wallet_session.id)
+        session['walletSession'] = mint_session_token(wallet_session)
         session.save()
 
         # Dapatkan halaman form (GET)
@@ -110,8 +117,7 @@ class WalletTests(TestCase):
         self.assertEqual(response.status_code, 200)
 
         # Pastikan saldo wallet bertambah
-        self.wallet.refresh_from_db()
-        self.assertEqual(self.wallet.saldo, 1500)
+        self.assertEqual(ledger.get_balance(self.wallet), 1500)
     # =============== UNHAPPY PATHS ===============
 
     def test_unauthenticated_user_login_wallet_redirects(self):
@@ -190,3 +196,293 @@ class WalletTests(TestCase):
 
         response = self.client.get(reverse('wallet:show_wallet'))
         self.assertEqual(response.status_code, 302)
+
+
+class PayOrderPipelineTests(TestCase):
+
+    def setUp(self):
+        Group.objects.create(name='Customer')
+        self.user = User.objects.create_user(username='payer', password='password123')
+        self.user.groups.add(Group.objects.get(name='Customer'))
+        self.customer = Customer.objects.create(user=self.user)
+
+        self.wallet_account = WalletAccount(user=self.user)
+        self.wallet_account.set_pin('123456')
+        self.wallet_account.save()
+        self.wallet = Wallet.objects.create(walletAccount=self.wallet_account, saldo=5000)
+
+        OrderStatus.objects.create(id=uuid.uuid4(), status='not paid')
+        OrderStatus.objects.create(id=uuid.uuid4(), status='paid')
+        self.product = Product.objects.create(product_name='rice', stock=10, price=1000, description='')
+        self.cart = Cart.objects.create(customer=self.customer, is_checked_out=True)
+        ProductCart.objects.create(cart=self.cart, product=self.product, quantity=3)
+        self.order = Order.objects.create(
+            cart=self.cart, status=OrderStatus.objects.get(status='not paid'), total=3000
+        )
+        self.client.login(username='payer', password='password123')
+        cache.clear()
+
+    def pay(self, key):
+        return self.client.post(
+            reverse('wallet:pay_order', args=[self.order.id]), {'pin': '123456', 'idempotency_key': key}
+        )
+
+    def test_retry_with_same_key_charges_once(self):
+        self.assertEqual(self.pay('key-1').status_code, 302)
+        self.assertEqual(self.pay('key-1').status_code, 302)
+
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(ledger.get_balance(self.wallet), 2000)
+        self.assertEqual(self.product.stock, 7)
+        self.assertEqual(self.order.status.status, 'paid')
+        self.assertEqual(PaymentRequest.objects.count(), 1)
+
+    def test_key_reused_for_another_order_is_rejected(self):
+        self.assertEqual(self.pay('key-1').status_code, 302)
+        other = Order.objects.create(
+            cart=Cart.objects.create(customer=self.customer, is_checked_out=True),
+            status=OrderStatus.objects.get(status='not paid'), total=1000,
+        )
+        response = self.client.post(reverse('wallet:pay_order', args=[other.id]), {'pin': '123456', 'idempotency_key': 'key-1'})
+        self.assertEqual(response.status_code, 400)
+
+        other.refresh_from_db()
+        self.assertEqual(other.status.status, 'not paid')
+        self.assertEqual(ledger.get_balance(self.wallet), 2000)
+
+    def test_insufficient_balance_rolls_back(self):
+        Wallet.objects.filter(id=self.wallet.id).update(saldo=1000)
+        response = self.pay('key-2')
+        self.assertEqual(response.status_code, 400)
+
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(self.order.status.status, 'not paid')
+        self.assertFalse(PaymentRequest.objects.exists())
+
+    def test_payment_token_skips_pin(self):
+        wallet_session = WalletSession.objects.create(walletAccount=self.wallet_account)
+        session = self.client.session
+        session['walletPaymentToken'] = mint_payment_token(wallet_session)
+        session.save()
+
+        response = self.client.post(reverse('wallet:pay_order', args=[self.order.id]), {'idempotency_key': 'key-3'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ledger.get_balance(self.wallet), 2000)
+
+        # logging out of the wallet revokes the payment token with the session
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_session_token(mint_session_token(wallet_session))
+        self.assertFalse(WalletSession.objects.exists())
+        self.assertFalse(check_payment_token(session['walletPaymentToken'], self.wallet_account))
+
+    def test_check_pin_rehashes_with_wallet_hasher(self):
+        self.wallet_account.pin_hasher = 'pbkdf2_sha1'
+        self.wallet_account.save(update_fields=['pin_hasher'])
+        self.assertTrue(self.wallet_account.check_pin('123456'))
+        self.wallet_account.refresh_from_db()
+        self.assertTrue(self.wallet_account.pin.startswith('pbkdf2_sha1$'))
+        self.assertTrue(self.wallet_account.check_pin('123456'))
+
+    def test_session_token_is_checked_without_database(self):
+        wallet_session = WalletSession.objects.create(walletAccount=self.wallet_account)
+        token = mint_session_token(wallet_session)
+        self.assertEqual(check_wallet_session(token), str(self.wallet_account.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(check_wallet_session(token), str(self.wallet_account.id))
+        self.assertIsNone(check_wallet_session(token + 'x'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_session(wallet_session)
+        self.assertIsNone(check_wallet_session(token))
+
+
+class WalletLedgerTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='ledger', password='password123')
+        user.groups.add(Group.objects.create(name='Customer'))
+        Customer.objects.create(user=user)
+        OrderStatus.objects.create(id=uuid.uuid4(), status='not paid')
+        self.wallet_account = WalletAccount.objects.create(user=user, pin='')
+        self.wallet = Wallet.objects.create(walletAccount=self.wallet_account, saldo=1000)
+
+    def test_balance_is_checkpoint_plus_later_entries(self):
+        ledger.credit(self.wallet, 500, WalletEntry.TOPUP)
+        self.assertTrue(ledger.debit(self.wallet, 1200))
+        self.assertFalse(ledger.debit(self.wallet, 400))
+        self.assertEqual(ledger.get_balance(self.wallet), 300)
+
+        # entries that may still be settling are left for the next checkpoint
+        self.assertIsNone(ledger.checkpoint(self.wallet))
+        checkpoint = ledger.checkpoint(self.wallet, now=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(checkpoint.balance, 300)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.saldo, 300)
+
+        ledger.credit(self.wallet, 50, WalletEntry.REFUND)
+        self.assertEqual(ledger.get_balance(self.wallet), 350)
+        self.assertEqual(WalletEntry.objects.filter(wallet=self.wallet).count(), 3)
+
+    def test_dashboard_pages_history(self):
+        for amount in range(1, 26):
+            ledger.credit(self.wallet, amount, WalletEntry.TOPUP)
+        self.client.login(username='ledger', password='password123')
+        wallet_session = WalletSession.objects.create(walletAccount=self.wallet_account)
+        session = self.client.session
+        session['walletSession'] = mint_session_token(wallet_session)
+        session.save()
+
+        response = self.client.get(reverse('wallet:show_wallet'))
+        self.assertEqual(len(response.context['history']), 20)
+        self.assertEqual(response.context['history'][0].amount, 25)
+        response = self.client.get(reverse('wallet:show_wallet'), {'cursor': response.context['history_cursor']})
+        self.assertEqual([entry.amount for entry in response.context['history']], [5, 4, 3, 2, 1])
+        self.assertIsNone(response.context['history_cursor'])
+
+
+class PinThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='throttled', password='password123')
+        self.wallet_account = WalletAccount.objects.create(user=user, pin='')
+
+    def test_failures_are_counted_without_database_writes(self):
+        now = time.time()
+        with self.assertNumQueries(0):
+            self.assertFalse(throttle.record_failure(self.wallet_account, now))
+            self.assertFalse(throttle.record_failure(self.wallet_account, now))
+        self.assertEqual(throttle.attempts_left(self.wallet_account, now), 1)
+
+        # the lockout itself is persisted
+        with self.assertNumQueries(1):
+            self.assertTrue(throttle.record_failure(self.wallet_account, now))
+        cache.clear()
+        self.wallet_account.refresh_from_db()
+        self.assertTrue(throttle.is_locked(self.wallet_account))
+
+        throttle.reset(self.wallet_account)
+        self.wallet_account.refresh_from_db()
+        self.assertFalse(throttle.is_locked(self.wallet_account))
+
+    def test_attempts_start_over_after_a_lockout(self):
+        window = settings.WALLET_PIN_WINDOW_SECONDS
+        now = (time.time() // window) * window
+        for i in range(3):
+            throttle.record_failure(self.wallet_account, now)
+        self.assertTrue(throttle.is_locked(self.wallet_account, now))
+
+        # the previous window would still weigh almost fully here
+        after = now + settings.WALLET_PIN_LOCKOUT_SECONDS + 1
+        cache.delete(throttle._lock_key(self.wallet_account.id))
+        self.assertFalse(throttle.is_locked(self.wallet_account, after))
+        self.assertFalse(throttle.record_failure(self.wallet_account, after))
+        self.assertEqual(throttle.attempts_left(self.wallet_account, after), 2)
+
+    def test_old_failures_slide_out_of_the_window(self):
+        window = settings.WALLET_PIN_WINDOW_SECONDS
+        start = (time.time() // window) * window
+        throttle.record_failure(self.wallet_account, start)
+        throttle.record_failure(self.wallet_account, start)
+        self.assertEqual(throttle.attempts_left(self.wallet_account, start + window / 2), 1)
+        # half of the previous window still overlaps, so it counts for half
+        self.assertEqual(throttle.attempts_left(self.wallet_account, start + window * 1.5), 2)
+        self.assertEqual(throttle.attempts_left(self.wallet_account, start + window * 2), 3)
+
+
+class DashboardPaymentHistoryTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='longtime', password='password123')
+        user.groups.add(Group.objects.create(name='Customer'))
+        customer = Customer.objects.create(user=user)
+        not_paid = OrderStatus.objects.create(id=uuid.uuid4(), status='not paid')
+        paid = OrderStatus.objects.create(id=uuid.uuid4(), status='paid')
+        self.wallet_account = WalletAccount.objects.create(user=user, pin='')
+        Wallet.objects.create(walletAccount=self.wallet_account, saldo=0)
+
+        for i in range(12):
+            cart = Cart.objects.create(customer=customer, is_checked_out=True)
+            order = Order.objects.create(cart=cart, status=paid, total=100)
+            OrderPayment.objects.create(order=order, walletAccount=self.wallet_account)
+        for i in range(3):
+            cart = Cart.objects.create(customer=customer, is_checked_out=True)
+            Order.objects.create(cart=cart, status=not_paid, total=50)
+
+        self.client.login(username='longtime', password='password123')
+        wallet_session = WalletSession.objects.create(walletAccount=self.wallet_account)
+        session = self.client.session
+        session['walletSession'] = mint_session_token(wallet_session)
+        session.save()
+
+    def test_payment_history_is_paged_with_totals(self):
+        response = self.client.get(reverse('wallet:show_wallet'))
+        self.assertEqual(len(response.context['payment_history']), 10)
+        self.assertEqual(response.context['payments_total'], 1000)
+        self.assertEqual(response.context['pending_total'], 150)
+        self.assertIsNone(response.context['pending_cursor'])
+
+        # saving a payment does not move it between pages
+        first_page = [payment.id for payment in response.context['payment_history']]
+        OrderPayment.objects.exclude(id__in=first_page).first().save()
+        self.assertEqual(response.context['payments_next'], f"?payments_cursor={response.context['payments_cursor']}")
+
+        response = self.client.get(reverse('wallet:show_wallet') + response.context['payments_next'])
+        self.assertEqual(len(response.context['payment_history']), 2)
+        self.assertEqual(response.context['payments_total'], 200)
+        self.assertIsNone(response.context['payments_cursor'])
+
+        # a next link keeps the cursors of the other lists
+        request = RequestFactory().get('/', {'cursor': 'a', 'pending_cursor': 'b'})
+        self.assertEqual(page_link(request, 'payments_cursor', 'c'), '?cursor=a&pending_cursor=b&payments_cursor=c')
+
+    def test_pending_orders_keep_their_page_when_saved(self):
+        customer = Customer.objects.get(user__username='longtime')
+        not_paid = OrderStatus.objects.get(status='not paid')
+        for i in range(9):
+            Order.objects.create(cart=Cart.objects.create(customer=customer, is_checked_out=True), status=not_paid, total=50)
+        pending = Order.objects.filter(status=not_paid).order_by('created_at', 'id')
+        now = timezone.now()
+        for i, order in enumerate(pending):
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(days=12 - i))
+
+        response = self.client.get(reverse('wallet:show_wallet'))
+        first_page = [order.id for order in response.context['pending_orders']]
+        self.assertEqual(len(first_page), 10)
+        Order.objects.get(pk=first_page[0]).save()
+
+        response = self.client.get(reverse('wallet:show_wallet') + response.context['pending_next'])
+        second_page = [order.id for order in response.context['pending_orders']]
+        self.assertEqual(len(second_page), 2)
+        self.assertFalse(set(first_page) & set(second_page))
+
+
+class PayoutSettlementTests(TestCase):
+
+    def setUp(self):
+        customer = Customer.objects.create(user=User.objects.create_user(username='buyer', password='password123'))
+        buyer_account = WalletAccount.objects.create(user=customer.user, pin='')
+        worker_user = User.objects.create_user(username='courier', password='password123')
+        self.wallet = Wallet.objects.create(walletAccount=WalletAccount.objects.create(user=worker_user, pin=''), saldo=0)
+        status = OrderStatus.objects.create(id=uuid.uuid4(), status='completed')
+        self.payments = []
+        for i in range(3):
+            order = Order.objects.create(cart=Cart.objects.create(customer=customer, is_checked_out=True), status=status, total=100)
+            self.payments.append(OrderPayment.objects.create(order=order, walletAccount=buyer_account, delivery_fee=10000))
+
+    def test_one_credit_per_wallet_per_settlement(self):
+        for payment in self.payments:
+            payouts.queue_payout(payment, self.wallet)
+        self.assertEqual(payouts.pending_total(self.wallet), 30000)
+        self.assertEqual(ledger.get_balance(self.wallet), 0)
+
+        self.assertEqual(payouts.settle_payouts(), 1)
+        self.assertEqual(ledger.get_balance(self.wallet), 30000)
+        self.assertEqual(WalletEntry.objects.filter(wallet=self.wallet, kind=WalletEntry.PAYOUT).count(), 1)
+        self.assertEqual(payouts.pending_total(self.wallet), 0)
+
+        # nothing left to settle
+        self.assertEqual(payouts.settle_payouts(), 0)
@@ -0,0 +1,81 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from .models import WalletAccount
+
+
+def _bucket_key(account_id, bucket):
+    return f'wallet:pin:{account_id}:{bucket}'
+
+def _lock_key(account_id):
+    return f'wallet:pin:lock:{account_id}'
+
+def failed_attempts(wallet_account, now=None):
+    """
+    Sliding window count of failed PIN attempts, estimated from the fixed window
+    counters of the current and the previous window. The previous one is weighted by
+    how much of it still overlaps the sliding window.
+    """
+    now = now or time.time()
+    window = settings.WALLET_PIN_WINDOW_SECONDS
+    bucket = int(now // window)
+    counts = cache.get_many([_bucket_key(wallet_account.id, bucket), _bucket_key(wallet_account.id, bucket - 1)])
+    current = counts.get(_bucket_key(wallet_account.id, bucket), 0)
+    previous = counts.get(_bucket_key(wallet_account.id, bucket - 1), 0)
+    return current + previous * (1 - (now % window) / window)
+
+def attempts_left(wallet_account, now=None):
+    return max(0, settings.WALLET_PIN_MAX_ATTEMPTS - int(failed_attempts(wallet_account, now)))
+
+def is_locked(wallet_account, now=None):
+    if cache.get(_lock_key(wallet_account.id)):
+        return True
+    # a lockout outlives a cache flush through the persisted attempt counter
+    now = now or time.time()
+    return (
+        wallet_account.login_attempts >= settings.WALLET_PIN_MAX_ATTEMPTS
+        and wallet_account.last_attempt.timestamp() + settings.WALLET_PIN_LOCKOUT_SECONDS > now
+    )
+
+def record_failure(wallet_account, now=None):
+    """
+    Count a failed PIN attempt in the cache. The database is only written when the
+    attempt triggers a lockout. Returns True when the account is now locked.
+    """
+    now = now or time.time()
+    window = settings.WALLET_PIN_WINDOW_SECONDS
+    bucket = int(now // window)
+    key = _bucket_key(wallet_account.id, bucket)
+    cache.add(key, 0, window * 2)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(key, 1, window * 2)
+
+    if failed_attempts(wallet_account, now) < settings.WALLET_PIN_MAX_ATTEMPTS:
+        return False
+    # the lockout replaces the counted failures, so the attempts start over once it ends
+    cache.delete_many([_bucket_key(wallet_account.id, bucket), _bucket_key(wallet_account.id, bucket - 1)])
+    cache.set(_lock_key(wallet_account.id), True, settings.WALLET_PIN_LOCKOUT_SECONDS)
+    locked_at = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+    WalletAccount.objects.filter(pk=wallet_account.pk).update(
+        login_attempts=settings.WALLET_PIN_MAX_ATTEMPTS, last_attempt=locked_at,
+    )
+    wallet_account.login_attempts = settings.WALLET_PIN_MAX_ATTEMPTS
+    wallet_account.last_attempt = locked_at
+    return True
+
+def reset(wallet_account, now=None):
+    # after a correct PIN, writes only when a lockout had been persisted
+    now = now or time.time()
+    bucket = int(now // settings.WALLET_PIN_WINDOW_SECONDS)
+    cache.delete_many([
+        _bucket_key(wallet_account.id, bucket),
+        _bucket_key(wallet_account.id, bucket - 1),
+        _lock_key(wallet_account.id),
+    ])
+    if wallet_account.login_attempts:
+        WalletAccount.objects.filter(pk=wallet_account.pk).update(login_attempts=0)
+        wallet_account.login_attempts = 0
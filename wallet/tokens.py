@@ -0,0 +1,85 @@
+import time
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import WalletSession, RevokedWalletSession
+
+SESSION_TOKEN_SALT = 'wallet.session'
+PAYMENT_TOKEN_SALT = 'wallet.payment'
+REVOKED_CACHE_KEY = 'wallet:session:revoked'
+REVOKED_CACHE_SECONDS = 60
+
+
+def _session_payload(wallet_session):
+    return {
+        'session': str(wallet_session.id),
+        'account': str(wallet_session.walletAccount_id),
+        'exp': int(wallet_session.revoked_at.timestamp()),
+    }
+
+def get_revoked_sessions():
+    # only sessions that have not expired yet are kept, so the set stays small
+    revoked = cache.get(REVOKED_CACHE_KEY)
+    if revoked is None:
+        revoked = frozenset(
+            str(session_id) for session_id in RevokedWalletSession.objects.filter(
+                expires_at__gt=timezone.now()
+            ).values_list('session_id', flat=True)
+        )
+        cache.set(REVOKED_CACHE_KEY, revoked, REVOKED_CACHE_SECONDS)
+    return revoked
+
+def _valid(payload):
+    return payload.get('exp', 0) > time.time() and payload.get('session') not in get_revoked_sessions()
+
+def mint_session_token(wallet_session):
+    """
+    HMAC signed wallet session carrying the wallet account id and the expiry, checked
+    on every wallet request without reading WalletSession.
+    """
+    return signing.dumps(_session_payload(wallet_session), salt=SESSION_TOKEN_SALT)
+
+def read_session_token(token):
+    # returns the payload of a valid token, None when it is forged, expired or revoked
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=SESSION_TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    return payload if _valid(payload) else None
+
+def revoke_session(wallet_session):
+    RevokedWalletSession.objects.filter(expires_at__lte=timezone.now()).delete()
+    RevokedWalletSession.objects.update_or_create(
+        session_id=wallet_session.id, defaults={'expires_at': wallet_session.revoked_at},
+    )
+    transaction.on_commit(lambda: cache.delete(REVOKED_CACHE_KEY))
+
+def revoke_session_token(token):
+    # wallet logout, the row goes away and the token stops verifying
+    payload = read_session_token(token)
+    if payload is None:
+        return
+    for wallet_session in WalletSession.objects.filter(id=payload['session']):
+        revoke_session(wallet_session)
+        wallet_session.delete()
+
+def mint_payment_token(wallet_session):
+    """
+    Signed payment authorization handed out by a successful wallet login. It is bound
+    to the wallet session, so revoking the session or the session expiring invalidates it.
+    """
+    return signing.dumps(_session_payload(wallet_session), salt=PAYMENT_TOKEN_SALT)
+
+def check_payment_token(token, wallet_account):
+    # a signature check instead of a PIN hash
+    if not token:
+        return False
+    try:
+        payload = signing.loads(token, salt=PAYMENT_TOKEN_SALT, max_age=settings.WALLET_PAYMENT_TOKEN_SECONDS)
+    except signing.BadSignature:
+        return False
+    return payload.get('account') == str(wallet_account.id) and _valid(payload)
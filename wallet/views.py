@@ -1,75 +1,94 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from .models import WalletAccount, Wallet, WalletSession, OrderPayment
+from .models import WalletAccount, Wallet, WalletSession, OrderPayment, PaymentRequest, WalletEntry
+from . import ledger, payouts, throttle
 from .forms import WalletAccountForm, WalletForm, LoginWalletForm, TopUpForm, PaymentForm
-from order.models import Order, OrderStatus
+from .tokens import mint_payment_token, check_payment_token, mint_session_token, read_session_token, revoke_session
+from main.models import Customer
+from order.models import Order
+from order import statuses
+from order.transitions import transition
+from django.db import transaction, IntegrityError
 from cart.models import ProductCart, Cart
+from cart.serializers import serialize_cart_lines
 from product.models import Product
+from product.reservations import commit_cart
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from core.pagination import keyset_page, parse_page_size
+from django.db.models import Sum
 import uuid
 
 stack = list()
-NOT_PAID_STATUS_ID = '11111111111111111111111111111111'
-PAID_STATUS_ID = '22222222222222222222222222222222'
-PREPARED_STATUS_ID = '33333333333333333333333333333333'
-READY_STATUS_ID = '44444444444444444444444444444444'
-DELIVERED_STATUS_ID = '55555555555555555555555555555555'
-COMPLETED_STATUS_ID = '66666666666666666666666666666666'
-REVIEWED_STATUS_ID = '77777777777777777777777777777777'
-CANCELLED_STATUS_ID = '88888888888888888888888888888888'
-
-def get_user_role(user):
-    user_group = user.groups.values_list('name', flat='True')
-    if len(user_group) == 1:
-        if user_group[0] == 'Admin':
-            return 'Admin'
-        elif user_group[0] == 'Customer':
-            return 'Customer'
-        else:
-            return 'Worker'
-    else:
-        return 'hey you mfs'
-
+WALLET_HISTORY_PAGE_SIZE = 20
+WALLET_ORDERS_PAGE_SIZE = 10
 
-def update_wallet_balance(wallet, amount):
-    wallet.saldo = amount
-    wallet.save()
+def page_with_total(queryset, ordering, cursor, total_field):
+    # one keyset page plus the SUM of `total_field` over just that page
+    rows, next_cursor = keyset_page(queryset, ordering, cursor, WALLET_ORDERS_PAGE_SIZE)
+    total = queryset.model.objects.filter(pk__in=[row.pk for row in rows]).aggregate(total=Sum(total_field))['total']
+    return rows, next_cursor, total or 0
 
 def update_product(cart):
-    product_carts = ProductCart.objects.filter(cart=cart)
-    for product_cart in product_carts:
-        product_cart.product.stock -= product_cart.quantity
-        product_cart.product.save()
+    # sells the stock held for this cart, returns the products that ran out
+    lines = ProductCart.objects.filter(cart=cart).values_list('product_id', 'quantity')
+    return commit_cart(cart.id, lines)
 
 def update_order_status(order, to_status):
-    to_status = OrderStatus.objects.get(pk=to_status)
-    order.status = to_status
-    order.save()
+    return transition(order, to_status)
+
+def page_link(request, name, cursor):
+    # next page link that keeps the cursors of the other lists on the page
+    if not cursor:
+        return None
+    params = request.GET.copy()
+    params[name] = cursor
+    return '?' + params.urlencode()
+
+def get_idempotency_key(request):
+    return (request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key') or '')[:64]
+
+def is_replayed_payment(walletAccount, order, key):
+    return bool(key) and PaymentRequest.objects.filter(walletAccount=walletAccount, order=order, key=key).exists()
+
+def process_payment(order, walletAccount, wallet, key):
+    """
+    Pay an order as one transaction: record the idempotency key, move the status to
+    paid, debit the wallet and sell the held stock. Returns an error message, or None
+    when the order is paid (including by an earlier request with the same key).
+    """
+    with transaction.atomic():
+        if key:
+            try:
+                with transaction.atomic():
+                    PaymentRequest.objects.create(walletAccount=walletAccount, order=order, key=key)
+            except IntegrityError:
+                # the same submit already went through, unless the key was used for another order
+                if PaymentRequest.objects.filter(walletAccount=walletAccount, key=key).exclude(order=order).exists():
+                    return 'this payment key was already used for another order'
+                return None
+        # the status moves first, a second submit of the same order stops here
+        if not update_order_status(order, statuses.PAID):
+            transaction.set_rollback(True)
+            return 'Already paid'
+        if not ledger.debit(wallet, order.total, WalletEntry.PAYMENT, order=order):
+            transaction.set_rollback(True)
+            return 'fail because you don\'t have enough balance'
+        if update_product(order.cart):
+            transaction.set_rollback(True)
+            return 'fail because some products are out of stock'
+    return None
 
 def order_detail(id):
     try:
         order = Order.objects.get(pk=id)
-        product_carts = ProductCart.objects.filter(cart=order.cart)
-
-        product_carts_json = [
-            {
-                'product' : {
-                    'product_id': product_cart.product.id,
-                    'product_name': product_cart.product.product_name,
-                    'product_stock': product_cart.product.stock,
-                    'product_price': product_cart.product.price,
-                    'product_description': product_cart.product.description
-                },
-                'id': product_cart.id,
-                'quantity': product_cart.quantity,
-            } for product_cart in product_carts
-        ]
+
+        product_carts_json, _ = serialize_cart_lines(order.cart_id)
         context = {
             'order': order,
             'cart_products': product_carts_json,
-            'can_cancel': str(order.status.status) in [
+            'can_cancel': statuses.status_name(order.status_id) in [
                 'not paid',
                 'paid',
             ]
@@ -80,10 +99,10 @@ def order_detail(id):
 
 @login_required
 def show_payment(request, id):
-    if (get_user_role(request.user) != 'Customer'):
+    if request.role != 'Customer':
         return JsonResponse({'message' : 'only customer could access this resource!'}, status=400)
 
-    customer = request.user.customer
+    customer = request.profile
     context = order_detail(id)
     if not context:
         return JsonResponse({'message': 'fail because order not found'}, status=400)
@@ -92,17 +111,19 @@ def show_payment(request, id):
 @csrf_exempt
 @login_required
 def pay_order(request, id):
-    if (get_user_role(request.user) != 'Customer'):
+    if request.role != 'Customer':
         return JsonResponse({'message' : 'only customer could access this resource!'}, status=400)
 
-    customer = request.user.customer
+    customer = request.profile
     try:
         order = Order.objects.get(pk=id)
     except:
         return JsonResponse({'message': 'order is not exist'}, status=400)
     walletAccount = WalletAccount.objects.get(user=request.user)
     wallet = Wallet.objects.get(walletAccount=walletAccount)
-    if order.status.id == uuid.UUID(PAID_STATUS_ID):
+    if request.method == 'POST' and is_replayed_payment(walletAccount, order, get_idempotency_key(request)):
+        return redirect('order:order_detail', id=order.id)
+    if statuses.status_name(order.status_id) == statuses.PAID:
         return JsonResponse({'message': 'Already paid'}, status=400)
 
     # check apakah sudah terautentikasi
@@ -111,7 +132,7 @@ def pay_order(request, id):
     except KeyError:
         walletSessionId = ''
 
-    if check_wallet_session(walletSessionId) != walletAccount:
+    if check_wallet_session(walletSessionId) != str(walletAccount.id):
         # login dulu, kembalikan ke halaman ini 
         stack.append(('wallet:payment_order', id))
         redirect('wallet:login_wallet')
@@ -125,27 +146,29 @@ def pay_order(request, id):
 
         if form.is_valid():
             pin = form.cleaned_data['pin']
+            # a payment token from the wallet login skips the PIN hash
+            authorized = check_payment_token(request.session.get('walletPaymentToken'), walletAccount)
 
-            walletAccount.reset_attempts_if_needed()
+            if not authorized:
+                if throttle.is_locked(walletAccount):
+                    return JsonResponse({'message': 'you don\'t any attempt left, wait 10 minutes'}, status=400)
 
-            if walletAccount.login_attempts > 3:
-                return JsonResponse({'message': 'you don\'t any attempt left, wait 10 minutes'}, status=400)
-
-            if walletAccount.check_pin(pin):
-                # check apakah uang pengguna cukup
-                if order.total > wallet.saldo:
-                    return JsonResponse({'message': 'fail because you don\'t have enough balance'}, status=400)
+                authorized = walletAccount.check_pin(pin)
+                if authorized:
+                    throttle.reset(walletAccount)
                 else:
-                    update_wallet_balance(wallet, wallet.saldo - order.total)
-                    update_product(order.cart)
-                    update_order_status(order, PAID_STATUS_ID)
-                    print('updated loh')
-                    return redirect('order:order_detail', id=order.id)
+                    throttle.record_failure(walletAccount)
+
+            if authorized:
+                error = process_payment(order, walletAccount, wallet, get_idempotency_key(request))
+                if error:
+                    return JsonResponse({'message': error}, status=400)
+                return redirect('order:order_detail', id=order.id)
 
         else:
             return JsonResponse({'message': 'you entered wrong password'}, status=400)
     else:
-        form = PaymentForm()
+        form = PaymentForm(initial={'idempotency_key': uuid.uuid4().hex})
         form = render_to_string('form_wallet.html', {'form': form}, request)
     return render(request, 'payment_order.html', context={'form': form, 'order': order, 'is_customer': True})
 
@@ -172,18 +195,14 @@ def register_wallet(request):
     else:
         form = WalletAccountForm()
     form = render_to_string('form_wallet.html', {'form': form}, request=request) 
-    try:
-        request.user.customer
-        is_customer = True
-    except:
-        is_customer = False
+    is_customer = isinstance(request.profile, Customer)
 
     return render(request, 'show_wallet.html', {'form': form, 'is_customer': is_customer})
 
 @csrf_exempt
 @login_required
 def topup_wallet(request):
-    walletAccount = check_wallet_session(request.session['walletSession'])
+    walletAccount = check_wallet_session(request.session.get('walletSession'))
 
     if not walletAccount:
         return redirect('wallet:login_wallet')
@@ -196,17 +215,13 @@ def topup_wallet(request):
         if form.is_valid():
             amount = form.cleaned_data['amount']
 
-            update_wallet_balance(wallet, wallet.saldo + amount)
+            ledger.credit(wallet, amount, WalletEntry.TOPUP)
             return redirect('wallet:show_wallet')
     else:
         form = TopUpForm()
 
     form = render_to_string('form_wallet.html', {'form': form}, request=request)
-    try:
-        request.user.customer
-        is_customer = True
-    except:
-        is_customer = False
+    is_customer = isinstance(request.profile, Customer)
     return render(request, 'show_wallet.html', {'form': form, 'is_customer': is_customer})
 
 @login_required
@@ -222,33 +237,30 @@ def login_wallet(request):
     if (len(wallet_account) == 0):
         return redirect('wallet:register_wallet')
 
-    MAX_ATTEMPTS = 3
     wallet_account = get_object_or_404(WalletAccount, user=request.user)
     
-    if wallet_account.login_attempts >= MAX_ATTEMPTS:
-        wallet_account.reset_attempts_if_needed()
+    if throttle.is_locked(wallet_account):
         return render(request, 'locked.html')
 
     if request.method == 'POST':
         form = LoginWalletForm(request.POST, wallet_account=wallet_account)
         if form.is_valid():
-            wallet_account.login_attempts = 0
-            wallet_account.save()
+            throttle.reset(wallet_account)
             # create session
-            wallet_session = WalletSession.objects.filter(walletAccount__user=request.user)
-            if len(wallet_session) > 0:
-                wallet_session[0].delete()
+            for old_session in WalletSession.objects.filter(walletAccount=wallet_account):
+                revoke_session(old_session)
+                old_session.delete()
             wallet_session = WalletSession.objects.create(walletAccount=wallet_account)
-            wallet_session.save()
-            request.session['walletSession'] = str(wallet_session.id)
+            request.session['walletSession'] = mint_session_token(wallet_session)
+            request.session['walletPaymentToken'] = mint_payment_token(wallet_session)
             if len(stack) > 0:
                 url = stack.pop()
                 redirect(url[0], id=url[1])
                 
             return redirect('wallet:show_wallet')
         else:
-            wallet_account.login_attempts += 1
-            wallet_account.save()
+            # counted in the cache, the database is written only on lockout
+            throttle.record_failure(wallet_account)
     else:
         form = LoginWalletForm(wallet_account=wallet_account)
 
@@ -258,10 +270,10 @@ def login_wallet(request):
     form = render_to_string('form_wallet.html', context, request=request)
     context = {
         'form': form,
-        'attempts_left': MAX_ATTEMPTS - wallet_account.login_attempts,
+        'attempts_left': throttle.attempts_left(wallet_account),
 
     }
-    user_role = get_user_role(request.user)
+    user_role = request.role
     if user_role == 'Admin':
         context['is_admin'] = True
     elif user_role == 'Customer':
@@ -280,42 +292,65 @@ def wallet_dashboard(request):
 
     wallet_account = get_object_or_404(WalletAccount, user=request.user)
     wallet = get_object_or_404(Wallet, walletAccount=wallet_account)
-    if get_user_role(request.user) == 'Customer':
-        unpaid_orders = Order.objects.filter(cart__customer=request.user.customer, status__id = NOT_PAID_STATUS_ID).order_by('created_at')
-        paid_orders = OrderPayment.objects.filter(order__cart__customer=request.user.customer).order_by('created_at')
+    try:
+        history, history_cursor = keyset_page(
+            WalletEntry.objects.filter(wallet=wallet), ['-id'], request.GET.get('cursor'),
+            parse_page_size(request.GET.get('page_size'), default=WALLET_HISTORY_PAGE_SIZE),
+        )
+    except ValueError:
+        return JsonResponse({'message': 'invalid cursor'}, status=400)
+    balance = ledger.get_balance(wallet)
+    if request.role == 'Customer':
+        customer = request.profile
+        try:
+            pending_orders, pending_cursor, pending_total = page_with_total(
+                Order.objects.filter(cart__customer=customer, status_id=statuses.status_id(statuses.NOT_PAID)),
+                ['created_at', 'id'], request.GET.get('pending_cursor'), 'total',
+            )
+            payment_history, payments_cursor, payments_total = page_with_total(
+                OrderPayment.objects.filter(order__cart__customer=customer).select_related('order', 'order__status', 'worker'),
+                ['-created_at', '-id'], request.GET.get('payments_cursor'), 'order__total',
+            )
+        except ValueError:
+            return JsonResponse({'message': 'invalid cursor'}, status=400)
         context = {
-            'payment_history': paid_orders,
-            'pending_orders': unpaid_orders,
-            'balance': wallet.saldo,
+            'payment_history': payment_history,
+            'payments_cursor': payments_cursor,
+            'payments_next': page_link(request, 'payments_cursor', payments_cursor),
+            'payments_total': payments_total,
+            'pending_orders': pending_orders,
+            'pending_cursor': pending_cursor,
+            'pending_next': page_link(request, 'pending_cursor', pending_cursor),
+            'pending_total': pending_total,
+            'balance': balance,
+            'history': history,
+            'history_cursor': history_cursor,
             'wallet_account': wallet_account,
             'is_customer': True,
         }
-    elif get_user_role(request.user) == 'Worker':
+    elif request.role == 'Worker':
         context = {
-            'balance': wallet.saldo,
+            'balance': balance,
+            'history': history,
+            'history_cursor': history_cursor,
+            'pending_payout': payouts.pending_total(wallet),
             'wallet_account': wallet_account,
             'is_worker': True,
         }
-    elif get_user_role(request.user) == 'Admin':
+    elif request.role == 'Admin':
         context = {
-            'balance': wallet.saldo,
+            'balance': balance,
+            'history': history,
+            'history_cursor': history_cursor,
             'wallet_account': wallet_account,
             'is_admin': True,
         }
+    context['history_next'] = page_link(request, 'cursor', history_cursor)
     return render(request, 'show_wallet.html', context)
 
-def check_wallet_session(sessionId):
-    try:
-        wallet = WalletSession.objects.get(id=uuid.UUID(sessionId))
-        if not wallet.is_expired():
-            return wallet
-        else:
-            wallet.delete()
-            return None
-
-    except WalletSession.DoesNotExist:
-        return None
-    except KeyError:
-        return None
-    except:
+def check_wallet_session(token):
+    # returns the wallet account id of a valid signed wallet session, no database access
+    payload = read_session_token(token)
+    if payload is None:
         return None
+    return payload['account']
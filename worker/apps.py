@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class WorkerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'worker'
+
+    def ready(self):
+        from order.transitions import status_changed
+        from .dispatch import on_status_changed
+        status_changed.connect(on_status_changed)
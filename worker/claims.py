@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import transaction
+from order import statuses
+from order.transitions import transition, transition_many
+from wallet.models import OrderPayment
+
+
+def _unclaimed():
+    # paid orders that are ready for pickup and have no worker yet
+    return OrderPayment.objects.filter(worker__isnull=True, order__status_id=statuses.status_id(statuses.READY))
+
+def claim_order(order_id, worker):
+    """
+    Assign a ready order to `worker` with one conditional UPDATE and move it to
+    delivered. Returns False when another worker claimed it first.
+    """
+    with transaction.atomic():
+        if not _unclaimed().filter(order_id=order_id).update(worker=worker):
+            return False
+        if not transition(order_id, statuses.DELIVERED):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+def claim_orders(worker, limit):
+    """
+    Claim up to `limit` of the oldest unclaimed ready orders for `worker` in one
+    UPDATE. Returns the ids of the orders won, possibly fewer than asked for.
+    """
+    limit = max(0, min(limit, settings.WORKER_MAX_BULK_CLAIM))
+    if not limit:
+        return []
+    with transaction.atomic():
+        candidates = list(_unclaimed().order_by('created_at', 'id').values_list('id', flat=True)[:limit])
+        # the worker__isnull check is repeated so rows taken meanwhile are skipped
+        claimed = _unclaimed().filter(id__in=candidates).update(worker=worker)
+        if not claimed:
+            return []
+        # only the candidates this UPDATE won, not every ready order the worker holds
+        order_ids = list(OrderPayment.objects.filter(
+            id__in=candidates, worker=worker,
+        ).order_by('created_at', 'id').values_list('order_id', flat=True))
+        if len(order_ids) != claimed or transition_many(order_ids, statuses.READY, statuses.DELIVERED) != claimed:
+            transaction.set_rollback(True)
+            return []
+    return order_ids
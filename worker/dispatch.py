@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from core import events
+from order import statuses
+from wallet.models import OrderPayment
+from .models import DispatchEntry
+
+DISPATCH_FEED_SIZE = 20
+
+# domiciles sharing a border, see main.models.domicile_choices
+DOMICILE_BORDERS = [
+    ('jakut', 'jakbar'), ('jakut', 'jakpus'), ('jakut', 'jaktim'), ('jakut', 'bekasi_kab'), ('jakut', 'tangerang_kab'),
+    ('jakbar', 'jakpus'), ('jakbar', 'jaksel'), ('jakbar', 'tangerang_kota'), ('jakbar', 'tangerang_kab'), ('jakbar', 'tangsel'),
+    ('jakpus', 'jaktim'), ('jakpus', 'jaksel'),
+    ('jaktim', 'jaksel'), ('jaktim', 'depok'), ('jaktim', 'bekasi_kota'),
+    ('jaksel', 'depok'), ('jaksel', 'tangsel'),
+    ('depok', 'bekasi_kota'), ('depok', 'bogor_kab'), ('depok', 'tangsel'),
+    ('bekasi_kota', 'bekasi_kab'), ('bekasi_kota', 'bogor_kab'),
+    ('bekasi_kab', 'bogor_kab'),
+    ('bogor_kota', 'bogor_kab'),
+    ('bogor_kab', 'tangsel'), ('bogor_kab', 'tangerang_kab'),
+    ('tangsel', 'tangerang_kota'), ('tangsel', 'tangerang_kab'),
+    ('tangerang_kota', 'tangerang_kab'),
+]
+
+ADJACENT_DOMICILES = {}
+for a, b in DOMICILE_BORDERS:
+    ADJACENT_DOMICILES.setdefault(a, set()).add(b)
+    ADJACENT_DOMICILES.setdefault(b, set()).add(a)
+
+
+def nearby_domiciles(domicile):
+    return [domicile, *sorted(ADJACENT_DOMICILES.get(domicile, ()))]
+
+def publish_channels(domicile):
+    # orders without a known domicile (e.g. the model default) go to the catch-all channel
+    if domicile in ADJACENT_DOMICILES:
+        return [f'dispatch:{domicile}']
+    return ['dispatch']
+
+def worker_channels(worker):
+    # everyone listens on the catch-all channel, workers without a domicile on every area
+    if worker.domicile in ADJACENT_DOMICILES:
+        domiciles = nearby_domiciles(worker.domicile)
+    else:
+        domiciles = sorted(ADJACENT_DOMICILES)
+    return [f'dispatch:{domicile}' for domicile in domiciles] + ['dispatch']
+
+def index_order(order_id):
+    payment = OrderPayment.objects.filter(order_id=order_id, worker__isnull=True).values(
+        'delivery_fee', 'order__cart__customer__domicile', 'order__cart__customer__user__username',
+    ).first()
+    if payment is None:
+        return None
+    entry, _ = DispatchEntry.objects.update_or_create(
+        order_id=order_id,
+        defaults={'domicile': payment['order__cart__customer__domicile'], 'delivery_fee': payment['delivery_fee']},
+    )
+    for channel in publish_channels(entry.domicile):
+        events.publish(channel, 'order-ready', {
+            'order_id': order_id,
+            'domicile': entry.domicile,
+            'delivery_fee': entry.delivery_fee,
+            'customer': payment['order__cart__customer__user__username'],
+        })
+    return entry
+
+def unindex_order(order_id):
+    domicile = DispatchEntry.objects.filter(order_id=order_id).values_list('domicile', flat=True).first()
+    if domicile is None:
+        return
+    DispatchEntry.objects.filter(order_id=order_id).delete()
+    for channel in publish_channels(domicile):
+        events.publish(channel, 'order-taken', {'order_id': order_id})
+
+def on_status_changed(sender, order_id, to_status, **kwargs):
+    if to_status == statuses.READY:
+        index_order(order_id)
+    else:
+        unindex_order(order_id)
+
+def rebuild_dispatch_index():
+    rows = list(OrderPayment.objects.filter(
+        worker__isnull=True, order__status_id=statuses.status_id(statuses.READY),
+    ).values_list('order_id', 'order__cart__customer__domicile', 'delivery_fee'))
+    with transaction.atomic():
+        DispatchEntry.objects.all().delete()
+        DispatchEntry.objects.bulk_create(
+            DispatchEntry(order_id=order_id, domicile=domicile, delivery_fee=delivery_fee)
+            for order_id, domicile, delivery_fee in rows
+        )
+    return len(rows)
+
+def feed_for(worker, limit=DISPATCH_FEED_SIZE):
+    """
+    Ready orders for `worker`: their own domicile first, then the adjacent ones, then
+    orders whose customer has no known domicile, oldest first within each. A worker
+    without a known domicile sees every ready order.
+    """
+    entries = DispatchEntry.objects.select_related('order__cart__customer__user')
+    if worker.domicile in ADJACENT_DOMICILES:
+        nearby = nearby_domiciles(worker.domicile)
+        entries = entries.filter(Q(domicile__in=nearby) | ~Q(domicile__in=ADJACENT_DOMICILES)).annotate(
+            rank=Case(
+                When(domicile=worker.domicile, then=Value(0)),
+                When(domicile__in=nearby, then=Value(1)),
+                default=Value(2), output_field=IntegerField(),
+            ),
+        ).order_by('rank', 'created_at')
+    else:
+        entries = entries.order_by('created_at')
+    return list(entries[:limit])
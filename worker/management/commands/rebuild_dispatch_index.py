@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from worker.dispatch import rebuild_dispatch_index
+
+class Command(BaseCommand):
+    help = 'rebuild the dispatch index of unassigned ready orders'
+
+    def handle(self, *args, **kwargs):
+        indexed = rebuild_dispatch_index()
+        print(f"{indexed} order siap diindeks")
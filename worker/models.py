@@ -1,3 +1,17 @@
 from django.db import models
+from order.models import Order
+from main.models import domicile_choices
 
-# Create your models here.
+
+class DispatchEntry(models.Model):
+    # one row per unassigned ready order, kept by worker.dispatch as orders enter
+    # and leave the ready status
+    class Meta:
+        indexes = [
+            models.Index(fields=['domicile', 'created_at'], name='dispatch_domicile_idx'),
+        ]
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True)
+    # the customer's domicile, where the order is delivered
+    domicile = models.CharField(max_length=100, choices=domicile_choices)
+    delivery_fee = models.DecimalField(max_digits=12, decimal_places=0)
+    created_at = models.DateTimeField(auto_now_add=True)
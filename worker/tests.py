@@ -1,3 +1,134 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from core.events import get_broker
+from django.contrib.auth.models import User
+from main.models import Customer, Worker
+from cart.models import Cart
+from order.models import Order, OrderStatus
+from wallet.models import WalletAccount, OrderPayment
+from order import transitions
+from .claims import claim_order, claim_orders
+from .models import DispatchEntry
+from . import dispatch
+import uuid
 
-# Create your tests here.
+
+class ClaimOrderTests(TestCase):
+
+    def setUp(self):
+        self.ready = OrderStatus.objects.create(id=uuid.uuid4(), status='ready')
+        self.delivered = OrderStatus.objects.create(id=uuid.uuid4(), status='delivered')
+        customer = Customer.objects.create(user=User.objects.create_user(username='buyer', password='password123'))
+        wallet_account = WalletAccount.objects.create(user=customer.user, pin='')
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(cart=Cart.objects.create(customer=customer, is_checked_out=True), status=self.ready, total=100)
+            OrderPayment.objects.create(order=order, walletAccount=wallet_account)
+            self.orders.append(order)
+        self.workers = [
+            Worker.objects.create(user=User.objects.create_user(username=f'worker{i}', password='password123'))
+            for i in range(2)
+        ]
+
+    def test_only_one_worker_wins_a_claim(self):
+        first, second = self.workers
+        self.assertTrue(claim_order(self.orders[0].id, first))
+        self.assertFalse(claim_order(self.orders[0].id, second))
+
+        payment = OrderPayment.objects.get(order=self.orders[0])
+        self.assertEqual(payment.worker, first)
+        self.orders[0].refresh_from_db()
+        self.assertEqual(self.orders[0].status, self.delivered)
+
+    def test_bulk_claim_takes_what_is_left(self):
+        first, second = self.workers
+        self.assertEqual(len(claim_orders(first, 2)), 2)
+        claimed = claim_orders(second, 5)
+        self.assertEqual(claimed, [self.orders[2].id])
+        self.assertEqual(claim_orders(second, 5), [])
+        self.assertEqual(Order.objects.filter(status=self.delivered).count(), 3)
+
+    def test_bulk_claim_returns_only_the_orders_it_won(self):
+        first = self.workers[0]
+        # a ready order already assigned to the worker is not part of a new claim
+        OrderPayment.objects.filter(order=self.orders[0]).update(worker=first)
+        self.assertEqual(claim_orders(first, 5), [self.orders[1].id, self.orders[2].id])
+        self.orders[0].refresh_from_db()
+        self.assertEqual(self.orders[0].status, self.ready)
+
+
+class DispatchFeedTests(TestCase):
+
+    def setUp(self):
+        OrderStatus.objects.create(id=uuid.uuid4(), status='prepared')
+        OrderStatus.objects.create(id=uuid.uuid4(), status='ready')
+        OrderStatus.objects.create(id=uuid.uuid4(), status='delivered')
+        self.worker = Worker.objects.create(
+            user=User.objects.create_user(username='courier', password='password123'), domicile='jaksel',
+        )
+        self.orders = {}
+        for domicile in ['depok', 'jaksel', 'bogor_kota']:
+            customer = Customer.objects.create(
+                user=User.objects.create_user(username=f'buyer-{domicile}', password='password123'), domicile=domicile,
+            )
+            order = Order.objects.create(
+                cart=Cart.objects.create(customer=customer, is_checked_out=True),
+                status=OrderStatus.objects.get(status='prepared'), total=100,
+            )
+            OrderPayment.objects.create(order=order, walletAccount=WalletAccount.objects.create(user=customer.user, pin=''))
+            with self.captureOnCommitCallbacks(execute=True):
+                transitions.transition(order.id, 'ready')
+            self.orders[domicile] = order
+
+    def test_feed_ranks_own_domicile_before_neighbours(self):
+        feed = dispatch.feed_for(self.worker)
+        self.assertEqual([entry.order_id for entry in feed], [self.orders['jaksel'].id, self.orders['depok'].id])
+
+    def test_claimed_orders_leave_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            claim_order(self.orders['jaksel'].id, self.worker)
+        self.assertEqual([entry.order_id for entry in dispatch.feed_for(self.worker)], [self.orders['depok'].id])
+
+        self.assertEqual(dispatch.rebuild_dispatch_index(), 2)
+        self.assertFalse(DispatchEntry.objects.filter(order=self.orders['jaksel']).exists())
+
+    def test_ready_and_taken_orders_are_pushed(self):
+        subscription = get_broker().subscribe(dispatch.worker_channels(self.worker))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                claim_order(self.orders['depok'].id, self.worker)
+            event = subscription.get(timeout=0)
+            self.assertEqual(event, {'event': 'order-taken', 'data': {'order_id': self.orders['depok'].id}})
+            # orders outside the worker's area are not pushed to them
+            with self.captureOnCommitCallbacks(execute=True):
+                claim_order(self.orders['bogor_kota'].id, self.worker)
+            self.assertIsNone(subscription.get(timeout=0))
+        finally:
+            get_broker().unsubscribe(subscription)
+
+    def test_orders_without_a_domicile_reach_every_worker(self):
+        customer = Customer.objects.create(user=User.objects.create_user(username='buyer-default', password='password123'))
+        order = Order.objects.create(
+            cart=Cart.objects.create(customer=customer, is_checked_out=True),
+            status=OrderStatus.objects.get(status='prepared'), total=100,
+        )
+        OrderPayment.objects.create(order=order, walletAccount=WalletAccount.objects.create(user=customer.user, pin=''))
+        subscription = get_broker().subscribe(dispatch.worker_channels(self.worker))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                transitions.transition(order.id, 'ready')
+            self.assertEqual(subscription.get(timeout=0)['data']['order_id'], order.id)
+        finally:
+            get_broker().unsubscribe(subscription)
+
+        feed = dispatch.feed_for(self.worker)
+        self.assertEqual(
+            [entry.order_id for entry in feed], [self.orders['jaksel'].id, self.orders['depok'].id, order.id],
+        )
+
+    @override_settings(EVENT_POLL_SECONDS=0)
+    def test_event_stream_endpoint(self):
+        self.client.login(username='courier', password='password123')
+        response = self.client.get(reverse('worker:ready_order_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(b''.join(response.streaming_content), b'retry: 500\n\n')
@@ -1,13 +1,14 @@
 from django.urls import path
-from .views import order_complete_page, complete_order_status, take_order_status, worker_homepage, worker_profile_page, complete_order
+from .views import order_complete_page, take_order_status, worker_homepage, worker_profile_page, complete_order, claim_ready_orders, ready_order_events
 
 app_name = "worker"
 
 urlpatterns = [
     path('complete-order/<uuid:id>', complete_order, name='complete_order' ),
     path("order-complete-page/", order_complete_page, name="order-complete-page"),
-    path("complete-order-status/", complete_order_status, name="complete-order-status"),
     path("take-order-status/<uuid:pk>/", take_order_status, name="take_order_status"),
+    path("claim-orders/", claim_ready_orders, name="claim_orders"),
+    path("events/", ready_order_events, name="ready_order_events"),
     path("", worker_homepage, name="homepage"),
     path("profile/", worker_profile_page, name="profile"),
 ]
@@ -1,17 +1,24 @@
 from django.shortcuts import render, redirect
 from wallet.models import OrderPayment, Wallet, WalletAccount
+from wallet.payouts import queue_payout
+from .claims import claim_order, claim_orders
+from .dispatch import feed_for, worker_channels
+from core.events import event_stream
+from django.views.decorators.http import require_POST
 from order.models import Order, OrderStatus
+from order import statuses
+from order.transitions import transition
+from django.db import transaction
 from django.http import HttpResponseForbidden, HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from main.models import Worker
+from review.models import WorkerRating
 
 def worker_required(view_func):
     def _wrapped_view(request, *args, **kwargs):
-        try:
-            # check if the user is linked to a Worker profile
-            worker = Worker.objects.get(user=request.user)
-        except Worker.DoesNotExist:
+        # the user must be linked to a Worker profile
+        if not isinstance(request.profile, Worker):
             return HttpResponseForbidden("Not authorized, you must be a worker!")
         return view_func(request, *args, **kwargs)
     return _wrapped_view
@@ -22,20 +29,20 @@ def complete_order(request, id):
     if request.method == 'POST':
         order = Order.objects.get(pk=id)
 
-        if order.status.status != 'delivered':
+        if statuses.status_name(order.status_id) != statuses.DELIVERED:
             return JsonResponse({'message': 'cannot complete completed order'})
         orderPayment = OrderPayment.objects.get(order=order)
 
-        if orderPayment.worker != request.user.worker:
+        if orderPayment.worker != request.profile:
             return JsonResponse({'message': 'you can not complete other people work'})
 
-        COMPLETED_STATUS_ID = '66666666666666666666666666666666'
-        order.status = OrderStatus.objects.get(pk=COMPLETED_STATUS_ID)
-        order.save()
+        with transaction.atomic():
+            if not transition(order, statuses.COMPLETED):
+                return JsonResponse({'message': 'cannot complete completed order'})
 
-        wallet = Wallet.objects.get(walletAccount__user = request.user)
-        wallet.saldo += orderPayment.delivery_fee
-        wallet.save()
+            # credited to the wallet by the settle_payouts job
+            wallet = Wallet.objects.get(walletAccount__user = request.user)
+            queue_payout(orderPayment, wallet)
     return redirect('order:order_detail', id=id)
 
 @login_required
@@ -49,20 +56,12 @@ def take_order_status(request, pk):
         return HttpResponseForbidden("Order not found")
 
     if request.method == "POST":
-        worker_user = request.user
-
-        try:
-            worker = Worker.objects.get(user=worker_user)
-        except Worker.DoesNotExist:
-            return HttpResponseForbidden("You are not linked to a worker profile")
-
+        worker = request.profile
         action = request.POST.get("action")
 
         if action == "take":
-            order = OrderPayment.objects.get(order=order)
-            order.set_worker(worker)
-            order.order.status = OrderStatus.objects.filter(status='delivered').first()
-            order.order.save()
+            if not claim_order(order_id, worker):
+                return HttpResponseForbidden("Order has already been taken")
             return redirect("order:order_detail", id=order_id)
         
         elif action == "decline":
@@ -79,43 +78,35 @@ def take_order_status(request, pk):
 
 @login_required
 @worker_required
-def complete_order_status(request):
-    if request.method == "POST":
-        worker = request.user
-        order_id = request.POST["order_id"]
-
-        try:
-            order = Order.objects.get(order_id=order_id)
-        except Order.DoesNotExist:
-            return HttpResponseForbidden("Order not found")
-
-        if order.worker.user_id == worker.user_id:
-            order.status = OrderStatus.objects.filter('completed').first()
-            order.status.save()
-        else:
-            return HttpResponseForbidden("You are not authorized to complete this order")
-
-        order.save()
-        return redirect("worker:order-complete-page")
-    
-    else:
-        return HttpResponseForbidden("Invalid request method")
+@require_POST
+def claim_ready_orders(request):
+    try:
+        count = int(request.POST.get('count', 1))
+    except ValueError:
+        return JsonResponse({'message': 'count must be a number'}, status=400)
+    order_ids = claim_orders(request.profile, count)
+    return JsonResponse({'claimed': [str(order_id) for order_id in order_ids]})
+
+
 def order_complete_page(request):
     return render(request, "order_complete.html")
 
 
+@login_required
+@worker_required
+def ready_order_events(request):
+    # one lookup when the stream opens, waiting for events does not touch the database
+    return event_stream(request, worker_channels(request.profile))
+
 @worker_required
 def worker_homepage(request):
-    # Get available orders that are not taken by any worker
-    available_orders = OrderPayment.objects.filter(worker__isnull=True, order__status__status='ready')
-    print("AVAILABLE ORDERS")
-    print(available_orders)
+    # ready orders in the worker's own and neighbouring domiciles
+    available_orders = feed_for(request.profile)
     context = {"orders": available_orders, 'is_worker': True}
     return render(request, "worker_homepage.html", context=context)
 
 @worker_required
 def worker_profile_page(request):
-    user = request.user
-    worker = Worker.objects.get(user=request.user)
-    context = {"worker": worker}
+    worker = request.profile
+    context = {"worker": worker, "rating": WorkerRating.objects.filter(worker=worker).first()}
     return render(request, "worker_profile_page.html", context=context)